@@ -4,6 +4,11 @@
 #include <zeno/types/AttrVector.h>
 #include <zeno/utils/vec.h>
 #include <array>
+#include <functional>
+#include <map>
+#include <memory>
+#include <set>
+#include <string>
 #include <vector>
 
 namespace zeno {
@@ -38,12 +43,167 @@ struct BlenderAxis : IObjectClone<BlenderAxis> {
 struct BlenderMesh : IObjectClone<BlenderMesh, BlenderAxis>, PolyMesh {
     bool is_smooth = false;
     bool use_auto_smooth = false;
+
+    // edge index of each loop, empty if edges are left for blender to compute
+    std::vector<int> loop_edge;
+    // custom split normals and uvs of each loop, empty if not exported
+    std::vector<vec3f> loop_nrm;
+    std::vector<vec2f> loop_uv;
+
+    // color layers exported as FLOAT_COLOR (or BYTE_COLOR if color_bytes)
+    // attributes, one rgba per vertex ("POINT") or per loop ("CORNER")
+    std::map<std::string, std::vector<vec4f>> colors;
+    std::string color_domain = "CORNER";
+    bool color_bytes = false;
+
+    // name of the collection instanced on each vertex, empty for plain meshes
+    std::string instance_collection;
+
+    // when set, vertices are borrowed from a PrimitiveObject instead of `vert`,
+    // and so are their attributes if shared_vert_attrs is also set
+    std::shared_ptr<AttrVector<vec3f>> shared_vert;
+    bool shared_vert_attrs = false;
+
+    inline AttrVector<vec3f> const &verts() const {
+        return shared_vert ? *shared_vert : vert;
+    }
+
+    inline auto const &vert_attrs() const {
+        return shared_vert && shared_vert_attrs ? shared_vert->attrs : vert.attrs;
+    }
+
+    // empty the mesh for the next apply, keeping the capacity of its buffers
+    // (attribute layers are dropped, as their set may change between applies)
+    inline void recycle() {
+        vert.values.clear();
+        vert.attrs.clear();
+        edge.values.clear();
+        edge.attrs.clear();
+        poly.values.clear();
+        poly.attrs.clear();
+        loop.values.clear();
+        loop.attrs.clear();
+        loop_edge.clear();
+        loop_nrm.clear();
+        loop_uv.clear();
+        colors.clear();
+        color_domain = "CORNER";
+        color_bytes = false;
+        instance_collection.clear();
+        shared_vert = nullptr;
+        shared_vert_attrs = false;
+        is_smooth = false;
+        use_auto_smooth = false;
+    }
+};
+
+// reuse the mesh held in `slot` if nobody else refers to it anymore,
+// otherwise place a fresh one there
+template <class Ptr>
+inline std::shared_ptr<BlenderMesh> recycle_mesh(Ptr &slot) {
+    auto mesh = std::dynamic_pointer_cast<BlenderMesh>(slot);
+    if (mesh && mesh.use_count() == 2) {
+        mesh->recycle();
+    } else {
+        mesh = std::make_shared<BlenderMesh>();
+        slot = mesh;
+    }
+    return mesh;
+}
+
+// merge vertices closer than 1/resolution of the mesh size (see preview.cpp)
+void decimate_mesh(BlenderMesh *mesh, int resolution);
+
+template <class Pool>
+inline bool is_pooled(Pool const &pool, std::string const &key, std::shared_ptr<BlenderMesh> const &mesh) {
+    auto it = pool.find(key);
+    return it != pool.end() && it->second == mesh;
+}
+
+// triangles of a collider in its local space, with a bounding volume hierarchy
+// over them (see collider.cpp); moving the collider only changes its matrix
+struct BlenderCollider : IObjectClone<BlenderCollider, BlenderAxis> {
+    struct BVHNode {
+        vec3f bmin, bmax;
+        int left = -1, right = -1;  // children, -1 for leaves
+        int start = 0, count = 0;  // triangles order[start, start + count) of a leaf
+    };
+
+    std::vector<vec3f> vert;
+    std::vector<vec3i> tris;
+    std::vector<int> order;
+    std::vector<BVHNode> nodes;
+
+    void build_bvh();
+    // closest point of the triangles to p, in local space; returns the triangle or -1
+    int closest_point(vec3f const &p, vec3f &closest) const;
+};
+
+struct BlenderCamera : IObjectClone<BlenderCamera, BlenderAxis> {
+    // world to clip space (projection times inverse matrix), opengl convention
+    std::array<std::array<float, 4>, 4> view_projection;
+    int width = 0, height = 0;
+    float clip_start = 0, clip_end = 0;
+    bool is_ortho = false;
+};
+
+struct BlenderImage : IObjectClone<BlenderImage> {
+    int width = 0, height = 0, channels = 4;
+    std::vector<float> pixels;  // row by row from the bottom, as bpy Image.pixels
+};
+
+// bodies of the blender texts, by the "zenotext:<sha1>" key the dumped scene
+// refers to them with; uploaded only when a text changes
+inline std::map<std::string, std::string> &text_bodies() {
+    static std::map<std::string, std::string> bodies;
+    return bodies;
+}
+
+struct Scene;
+struct PrimitiveObject;
+
+// objects computed once by the shared graph of a scene and handed to every
+// tree using them, see tree_compiler.share_common_nodes; keys are node content
+// hashes, dropped along with the scene
+inline std::map<Scene const *, std::map<std::string, std::shared_ptr<IObject>>> &shared_objects() {
+    static std::map<Scene const *, std::map<std::string, std::shared_ptr<IObject>>> objects;
+    return objects;
+}
+
+struct BlenderVolume : IObjectClone<BlenderVolume, BlenderAxis> {
+    std::string path;  // the .vdb file written for the current frame
+};
+
+struct BlenderCurves : IObjectClone<BlenderCurves, BlenderAxis> {
+    AttrVector<vec3f> point;
+    std::vector<int> curve_offsets{0};  // curve i spans points [offsets[i], offsets[i+1])
+    std::vector<char> cyclic;  // whether curve i is closed
 };
 
 struct BlenderData {
     std::set<std::string> input_names;
+    // mesh components each input is consumed with: "matrix", "vert", "edge", "poly"
+    std::map<std::string, std::set<std::string>> input_components;
     std::map<std::string, std::function<std::shared_ptr<BlenderAxis>()>> inputs;
+    // converted input meshes kept across applies for transform-only updates
+    std::map<std::string, std::shared_ptr<BlenderMesh>> input_cache;
+    // uncached input meshes, refilled in place by the next apply (see recycle_mesh)
+    std::map<std::string, std::shared_ptr<BlenderMesh>> input_pool;
+    // also reused by the output nodes on their next apply
     std::map<std::string, std::shared_ptr<BlenderAxis>> outputs;
+    // local-space primitives kept with the cached input mesh they were converted
+    // from, by BlenderInputPrimitive node
+    std::map<std::string, std::pair<std::weak_ptr<BlenderMesh>, std::shared_ptr<PrimitiveObject>>> input_prims;
+    // colliders kept with the cached input mesh they were built from, see BlenderInputCollider
+    std::map<std::string, std::pair<std::weak_ptr<BlenderMesh>, std::shared_ptr<BlenderCollider>>> colliders;
+    // images read by BlenderInputImage, refilled by graphAllocImage only when they change
+    std::set<std::string> image_names;
+    std::map<std::string, std::shared_ptr<BlenderImage>> images;
+
+    int frame = 0;
+    std::string cache_dir;
+    // grid resolution input meshes are decimated to while previewing, 0 for full
+    int preview_resolution = 0;
 
     std::vector<std::vector<float>> line_vertices;
     std::vector<std::vector<int>> line_indices;
@@ -19,19 +19,25 @@ bl_info = {
 }
 
 
-from . import (
-    scenario,
-    node_system,
-    execute_operator,
-    gpu_drawer,
-)
-
-modules = (
-    scenario,
-    node_system,
-    execute_operator,
-    gpu_drawer,
-)
+try:
+    import bpy
+except ImportError:  # imported outside of blender, only zenoblend.api is usable
+    bpy = None
+
+if bpy is not None:
+    from . import (
+        scenario,
+        node_system,
+        execute_operator,
+        gpu_drawer,
+    )
+
+    modules = (
+        scenario,
+        node_system,
+        execute_operator,
+        gpu_drawer,
+    )
 
 
 def register():
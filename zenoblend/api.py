@@ -0,0 +1,298 @@
+'''
+Evaluate Zeno node trees on NumPy arrays, without any Blender objects.
+
+    from zenoblend import api
+    outputs = api.evaluate(jsonStr, inputs={'Cube': (verts, faces)})
+    outputs['Result']['verts']
+
+`jsonStr` is what `tree_dumper.dump_scene` produces (a ZenoNodeTree may be
+passed instead when running inside of Blender). Each input is given as
+`(verts, faces)`, `(verts, faces, attrs)`, `(verts, faces, edges)` or a dict
+with any of the keys `verts`, `faces`, `edges`, `attrs` and `matrix`, where
+`attrs` maps names to per-vertex arrays of shape (n,) or (n, 3); inputs only
+consumed as transforms may also be given as a bare 4x4 matrix. Cameras are dicts with a `matrix`, a
+`view_projection` matrix and optionally `resolution`, `clip_range` and
+`is_ortho`. Images read by BlenderInputImage
+nodes are given as float arrays of shape (height, width, channels), bottom
+row first like bpy's Image.pixels.
+'''
+
+import ctypes
+import os
+import tempfile
+
+import numpy as np
+
+from .dll import core, requireScene
+
+
+# mirrors of the DNA structs in include/blender/DNA_meshdata_types.h
+MVert = np.dtype([('co', '<f4', 3), ('no', '<i2', 3), ('flag', 'u1'), ('bweight', 'u1')])
+MEdge = np.dtype([('v1', '<u4'), ('v2', '<u4'), ('crease', 'u1'), ('bweight', 'u1'), ('flag', '<i2')])
+MPoly = np.dtype([('loopstart', '<i4'), ('totloop', '<i4'), ('mat_nr', '<i2'), ('flag', 'i1'), ('_pad', 'i1')])
+MLoop = np.dtype([('v', '<u4'), ('e', '<u4')])
+MLoopUV = np.dtype([('uv', '<f4', 2), ('flag', '<i4')])
+MLoopCol = np.dtype([('r', 'u1'), ('g', 'u1'), ('b', 'u1'), ('a', 'u1')])
+
+IDENTITY = tuple(tuple(float(i == j) for j in range(4)) for i in range(4))
+
+attr_dtypes = {
+    'FLOAT': (np.float32, ()),
+    'INT': (np.int32, ()),
+    'FLOAT2': (np.float32, (2,)),
+    'FLOAT_VECTOR': (np.float32, (3,)),
+    'FLOAT_COLOR': (np.float32, (4,)),
+    'BYTE_COLOR': (np.uint8, (4,)),
+}
+
+
+def _ptr(arr):
+    return arr.ctypes.data if len(arr) else 0
+
+
+def _polygons(faces):
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        sizes = np.full(len(faces), faces.shape[1], dtype=np.int32)
+        loops = faces.ravel()
+    else:
+        faces = [np.asarray(face).ravel() for face in faces]
+        sizes = np.array([len(face) for face in faces], dtype=np.int32)
+        loops = np.concatenate(faces) if faces else np.empty(0, dtype=np.int32)
+    return sizes, loops
+
+
+def mesh_buffers(verts, faces=(), edges=()):
+    '''Pack vertices, faces and edges into the DNA arrays graphSetInputMesh reads'''
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    vert = np.zeros(len(verts), dtype=MVert)
+    vert['co'] = verts
+
+    sizes, loops = _polygons(faces)
+    loop = np.zeros(len(loops), dtype=MLoop)
+    loop['v'] = loops
+    poly = np.zeros(len(sizes), dtype=MPoly)
+    poly['totloop'] = sizes
+    poly['loopstart'][1:] = np.cumsum(sizes)[:-1]
+
+    edges = np.asarray(edges, dtype=np.uint32).reshape(-1, 2)
+    edge = np.zeros(len(edges), dtype=MEdge)
+    edge['v1'] = edges[:, 0]
+    edge['v2'] = edges[:, 1]
+    return vert, loop, poly, edge
+
+
+def _is_matrix(spec):
+    try:
+        return np.asarray(spec, dtype=float).shape == (4, 4)
+    except (ValueError, TypeError):  # ragged, e.g. a (verts, faces) tuple
+        return False
+
+
+def _input_spec(spec):
+    if isinstance(spec, dict):
+        return spec
+    if _is_matrix(spec):
+        return {'matrix': spec}
+    if len(spec) == 3 and isinstance(spec[2], dict):
+        return dict(zip(('verts', 'faces', 'attrs'), spec))
+    return dict(zip(('verts', 'faces', 'edges'), spec))
+
+
+def set_vert_attrs(graphPtr, name, attrs):
+    '''Attach per-vertex attributes to an input, after its mesh buffers were set'''
+    for attrName, arr in attrs.items():
+        arr = np.ascontiguousarray(arr, dtype=np.float32)
+        if arr.ndim == 1:
+            components = 1
+        elif arr.ndim == 2 and arr.shape[1] == 3:
+            components = 3
+        else:
+            raise ValueError('Vertex attribute `{}` must have shape (n,) or (n, 3), got {}'.format(
+                attrName, arr.shape))
+        core.graphSetInputVertAttr(graphPtr, name, attrName, _ptr(arr), len(arr), components)
+
+
+def set_input(graphPtr, name, spec):
+    '''Feed one input of the current graph, returns the buffers to keep alive until applied'''
+    spec = _input_spec(spec)
+    matrix = tuple(map(tuple, np.asarray(spec.get('matrix', IDENTITY), dtype=float)))
+    if 'view_projection' in spec:
+        core.graphSetInputCamera(graphPtr, name, matrix,
+                tuple(map(tuple, np.asarray(spec['view_projection'], dtype=float))),
+                tuple(spec.get('resolution', (1920, 1080))), tuple(spec.get('clip_range', (0.1, 100.0))),
+                bool(spec.get('is_ortho', False)))
+        return ()
+    if 'verts' not in spec:
+        core.graphSetInputAxis(graphPtr, name, matrix)
+        return ()
+    buffers = mesh_buffers(spec['verts'], spec.get('faces', ()), spec.get('edges', ()))
+    set_mesh_buffers(graphPtr, name, matrix, buffers)
+    set_vert_attrs(graphPtr, name, spec.get('attrs', {}))
+    return buffers
+
+
+def set_mesh_buffers(graphPtr, name, matrix, buffers):
+    '''Feed an input from ready MVert, MLoop, MPoly and MEdge arrays'''
+    vert, loop, poly, edge = buffers
+    core.graphSetInputMesh(graphPtr, name, tuple(map(tuple, matrix)),
+            _ptr(vert), len(vert), _ptr(loop), len(loop),
+            _ptr(poly), len(poly), _ptr(edge), len(edge), False)
+
+
+def set_image(graphPtr, name, pixels):
+    '''Feed an image from a (height, width, channels) float array'''
+    pixels = np.ascontiguousarray(pixels, dtype=np.float32)
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    height, width, channels = pixels.shape
+    ptr = core.graphAllocImage(graphPtr, name, width, height, channels)
+    if pixels.size:
+        ctypes.memmove(ptr, pixels.ctypes.data, pixels.nbytes)
+
+
+def get_mesh(meshPtr):
+    '''Read an output mesh into NumPy arrays'''
+    manifest = core.meshGetManifest(meshPtr)
+    vert = np.zeros(manifest['vert_count'], dtype=MVert)
+    loop = np.zeros(manifest['loop_count'], dtype=MLoop)
+    poly = np.zeros(manifest['poly_count'], dtype=MPoly)
+    edge = np.zeros(manifest['edge_count'], dtype=MEdge)
+    uv = np.zeros(manifest['loop_count'] if manifest['has_loop_uvs'] else 0, dtype=MLoopUV)
+    normals = np.zeros((manifest['loop_count'] if manifest['has_loop_normals'] else 0, 3), dtype=np.float32)
+
+    counts = {'POINT': len(vert), 'FACE': len(poly), 'CORNER': len(loop)}
+    attrs = {}
+    for attrName, domain, dataType in manifest['attrs']:
+        dtype, shape = attr_dtypes[dataType]
+        attrs[attrName] = domain, np.zeros((counts[domain],) + shape, dtype=dtype)
+
+    core.meshWriteBuffers(meshPtr, _ptr(vert), _ptr(loop), _ptr(poly), _ptr(edge),
+            _ptr(uv), _ptr(normals), [_ptr(arr) for domain, arr in attrs.values()])
+
+    result = {
+        'matrix': np.array(manifest['matrix'], dtype=np.float32),
+        'verts': vert['co'],
+        'loops': loop['v'].astype(np.int32),
+        'loop_start': poly['loopstart'],
+        'loop_total': poly['totloop'],
+        'edges': np.stack([edge['v1'], edge['v2']], axis=-1).astype(np.int32),
+        'attrs': attrs,
+        'is_smooth': manifest['is_smooth'],
+    }
+    if manifest['has_loop_uvs']:
+        result['uvs'] = uv['uv']
+    if manifest['has_loop_normals']:
+        result['normals'] = normals
+    if manifest['instance_collection']:
+        result['instance_collection'] = manifest['instance_collection']
+    return result
+
+
+def get_curves(curvesPtr):
+    '''Read an output curves object into NumPy arrays'''
+    curveCount = core.curvesGetCurvesCount(curvesPtr)
+    pointCount = core.curvesGetPointsCount(curvesPtr)
+    sizes = np.empty(curveCount, dtype=np.int32)
+    core.curvesGetSizes(curvesPtr, _ptr(sizes), curveCount)
+    points = np.empty((pointCount, 3), dtype=np.float32)
+    core.curvesGetPoints(curvesPtr, _ptr(points), pointCount)
+    cyclic = np.empty(curveCount, dtype=bool)
+    core.curvesGetCyclic(curvesPtr, _ptr(cyclic), curveCount)
+    attrs = {}
+    for attrName, dataType in core.curvesGetPointAttrNameType(curvesPtr).items():
+        dtype, shape = attr_dtypes[dataType]
+        attrs[attrName] = np.empty((pointCount,) + shape, dtype=dtype)
+        core.curvesGetPointAttr(curvesPtr, attrName, _ptr(attrs[attrName]), pointCount)
+    return {'sizes': sizes, 'points': points, 'cyclic': cyclic, 'attrs': attrs}
+
+
+def get_output(graphPtr, name):
+    outType = core.graphGetOutputType(graphPtr, name)
+    outPtr = core.graphGetOutputMesh(graphPtr, name)
+    if outType == 'volume':
+        return {'path': core.volumeGetPath(outPtr)}
+    if outType == 'curves':
+        return get_curves(outPtr)
+    return get_mesh(outPtr)
+
+
+def _scene_json(tree_or_json):
+    if isinstance(tree_or_json, str):
+        return tree_or_json, None, {}
+    from .tree_dumper import dump_scene, text_bodies  # a ZenoNodeTree, only available in blender
+    return dump_scene(), tree_or_json.name, dict(text_bodies)
+
+
+def _first_graph_name(jsonStr):
+    import json
+    for command in json.loads(jsonStr):
+        if command[0] == 'switchGraph':
+            return command[1]
+    raise RuntimeError('No graph in scene')
+
+
+class Scene:
+    '''A loaded Zeno scene, whose graphs can be evaluated repeatedly'''
+
+    def __init__(self, tree_or_json, texts=None):
+        self.jsonStr, self.default_graph, dumpedTexts = _scene_json(tree_or_json)
+        if self.default_graph is None:
+            self.default_graph = _first_graph_name(self.jsonStr)
+        # bodies of the `zenotext:` keys the scene refers to BlenderInputText nodes with
+        for key, body in dict(dumpedTexts, **(texts or {})).items():
+            core.textSetBody(key, body)
+        requireScene(self.jsonStr)
+        self.sceneId = core.createScene()
+        core.sceneLoadFromJson(self.sceneId, self.jsonStr)
+
+    def graph(self, graph_name=None):
+        core.sceneSwitchToGraph(self.sceneId, graph_name or self.default_graph)
+        return core.sceneGetCurrentGraph(self.sceneId)
+
+    def prepare(self, graph_name=None, frame=0, cache_dir=None, preview=0):
+        '''Switch to a graph and set up its frame, returns the graph pointer'''
+        graphPtr = self.graph(graph_name)
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'zeno_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        core.graphClearDrawBuffer(graphPtr)
+        core.graphSetFrameInfo(graphPtr, frame, cache_dir)
+        core.graphSetPreview(graphPtr, preview)
+        return graphPtr
+
+    def evaluate(self, inputs=None, graph_name=None, frame=0, cache_dir=None, preview=0):
+        graphPtr = self.prepare(graph_name, frame, cache_dir, preview)
+        inputs = inputs or {}
+
+        keepAlive = []  # the graph reads input buffers lazily during apply
+        for name in core.graphGetInputNames(graphPtr):
+            if name not in inputs:
+                raise RuntimeError('No input named `{}` given'.format(name))
+            keepAlive.append(set_input(graphPtr, name, inputs[name]))
+        for name in core.graphGetImageNames(graphPtr):
+            if name not in inputs:
+                raise RuntimeError('No image named `{}` given'.format(name))
+            set_image(graphPtr, name, inputs[name])
+
+        core.graphApply(graphPtr)
+        del keepAlive
+
+        return {name: get_output(graphPtr, name) for name in core.graphGetOutputNames(graphPtr)}
+
+    def close(self):
+        if self.sceneId is not None:
+            core.deleteScene(self.sceneId)
+            self.sceneId = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def evaluate(tree_or_json, inputs=None, graph_name=None, frame=0, cache_dir=None, preview=0, texts=None):
+    '''Evaluate one graph on the given inputs, returns {output name: arrays}'''
+    with Scene(tree_or_json, texts) as scene:
+        return scene.evaluate(inputs, graph_name, frame, cache_dir, preview)
@@ -0,0 +1,221 @@
+#include <zeno/zeno.h>
+#include "BlenderMesh.h"
+#include <zeno/types/PrimitiveObject.h>
+#include <algorithm>
+#include <cmath>
+#include <limits>
+
+namespace zeno {
+
+static constexpr int kLeafSize = 4;
+
+static int build_node(BlenderCollider *collider, std::vector<vec3f> const &centers, int start, int count) {
+    int id = collider->nodes.size();
+    collider->nodes.emplace_back();
+
+    auto const &tris = collider->tris;
+    auto const &vert = collider->vert;
+    auto *order = collider->order.data();
+    vec3f bmin = vert[tris[order[start]][0]], bmax = bmin;
+    for (int k = start; k < start + count; k++) {
+        for (int j = 0; j < 3; j++) {
+            bmin = zeno::min(bmin, vert[tris[order[k]][j]]);
+            bmax = zeno::max(bmax, vert[tris[order[k]][j]]);
+        }
+    }
+    collider->nodes[id].bmin = bmin;
+    collider->nodes[id].bmax = bmax;
+
+    if (count <= kLeafSize) {
+        collider->nodes[id].start = start;
+        collider->nodes[id].count = count;
+        return id;
+    }
+
+    // median split of the triangle centers along the longest side
+    auto ext = bmax - bmin;
+    int axis = ext[0] > ext[1] ? (ext[0] > ext[2] ? 0 : 2) : (ext[1] > ext[2] ? 1 : 2);
+    int half = count / 2;
+    std::nth_element(order + start, order + start + half, order + start + count,
+            [&] (int a, int b) { return centers[a][axis] < centers[b][axis]; });
+    int left = build_node(collider, centers, start, half);
+    int right = build_node(collider, centers, start + half, count - half);
+    collider->nodes[id].left = left;
+    collider->nodes[id].right = right;
+    return id;
+}
+
+void BlenderCollider::build_bvh() {
+    nodes.clear();
+    order.resize(tris.size());
+    if (tris.empty())
+        return;
+    std::vector<vec3f> centers(tris.size());
+    #pragma omp parallel for
+    for (int i = 0; i < tris.size(); i++) {
+        order[i] = i;
+        centers[i] = (vert[tris[i][0]] + vert[tris[i][1]] + vert[tris[i][2]]) / 3.f;
+    }
+    build_node(this, centers, 0, tris.size());
+}
+
+// Real-Time Collision Detection (Ericson), 5.1.5
+static vec3f closest_on_triangle(vec3f const &p, vec3f const &a, vec3f const &b, vec3f const &c) {
+    auto ab = b - a, ac = c - a, ap = p - a;
+    float d1 = dot(ab, ap), d2 = dot(ac, ap);
+    if (d1 <= 0 && d2 <= 0) return a;
+    auto bp = p - b;
+    float d3 = dot(ab, bp), d4 = dot(ac, bp);
+    if (d3 >= 0 && d4 <= d3) return b;
+    float vc = d1 * d4 - d3 * d2;
+    if (vc <= 0 && d1 >= 0 && d3 <= 0) return a + ab * (d1 / (d1 - d3));
+    auto cp = p - c;
+    float d5 = dot(ab, cp), d6 = dot(ac, cp);
+    if (d6 >= 0 && d5 <= d6) return c;
+    float vb = d5 * d2 - d1 * d6;
+    if (vb <= 0 && d2 >= 0 && d6 <= 0) return a + ac * (d2 / (d2 - d6));
+    float va = d3 * d6 - d5 * d4;
+    if (va <= 0 && d4 - d3 >= 0 && d5 - d6 >= 0)
+        return b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)));
+    float denom = 1 / (va + vb + vc);
+    return a + ab * (vb * denom) + ac * (vc * denom);
+}
+
+static float box_distance2(vec3f const &p, vec3f const &bmin, vec3f const &bmax) {
+    float d2 = 0;
+    for (int k = 0; k < 3; k++) {
+        float d = std::max(std::max(bmin[k] - p[k], p[k] - bmax[k]), 0.f);
+        d2 += d * d;
+    }
+    return d2;
+}
+
+int BlenderCollider::closest_point(vec3f const &p, vec3f &closest) const {
+    int best = -1;
+    float best_d2 = std::numeric_limits<float>::infinity();
+    if (nodes.empty())
+        return best;
+
+    int stack[64], top = 0;
+    stack[top++] = 0;
+    while (top) {
+        auto const &node = nodes[stack[--top]];
+        if (box_distance2(p, node.bmin, node.bmax) >= best_d2)
+            continue;
+        if (node.left < 0) {
+            for (int k = node.start; k < node.start + node.count; k++) {
+                auto const &t = tris[order[k]];
+                auto q = closest_on_triangle(p, vert[t[0]], vert[t[1]], vert[t[2]]);
+                float d2 = dot(p - q, p - q);
+                if (d2 < best_d2) {
+                    best_d2 = d2;
+                    best = order[k];
+                    closest = q;
+                }
+            }
+            continue;
+        }
+        // visit the nearer child first, it is popped last
+        auto const &l = nodes[node.left], &r = nodes[node.right];
+        bool left_first = box_distance2(p, l.bmin, l.bmax) < box_distance2(p, r.bmin, r.bmax);
+        stack[top++] = left_first ? node.right : node.left;
+        stack[top++] = left_first ? node.left : node.right;
+    }
+    return best;
+}
+
+}
+
+
+namespace {
+using namespace zeno;
+
+static vec3f transform_point(float const m[3][4], vec3f const &p) {
+    return vec3f(
+        m[0][0] * p[0] + m[0][1] * p[1] + m[0][2] * p[2] + m[0][3],
+        m[1][0] * p[0] + m[1][1] * p[1] + m[1][2] * p[2] + m[1][3],
+        m[2][0] * p[0] + m[2][1] * p[1] + m[2][2] * p[2] + m[2][3]);
+}
+
+// inverse of an affine transform, both as 3x4 matrices
+static void affine_inverse(float const m[3][4], float inv[3][4]) {
+    float det = m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
+              - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
+              + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0]);
+    float id = 1 / det;
+    inv[0][0] = (m[1][1] * m[2][2] - m[1][2] * m[2][1]) * id;
+    inv[0][1] = (m[0][2] * m[2][1] - m[0][1] * m[2][2]) * id;
+    inv[0][2] = (m[0][1] * m[1][2] - m[0][2] * m[1][1]) * id;
+    inv[1][0] = (m[1][2] * m[2][0] - m[1][0] * m[2][2]) * id;
+    inv[1][1] = (m[0][0] * m[2][2] - m[0][2] * m[2][0]) * id;
+    inv[1][2] = (m[0][2] * m[1][0] - m[0][0] * m[1][2]) * id;
+    inv[2][0] = (m[1][0] * m[2][1] - m[1][1] * m[2][0]) * id;
+    inv[2][1] = (m[0][1] * m[2][0] - m[0][0] * m[2][1]) * id;
+    inv[2][2] = (m[0][0] * m[1][1] - m[0][1] * m[1][0]) * id;
+    for (int r = 0; r < 3; r++) {
+        inv[r][3] = -(inv[r][0] * m[0][3] + inv[r][1] * m[1][3] + inv[r][2] * m[2][3]);
+    }
+}
+
+
+struct BlenderColliderProject : INode {
+    virtual void apply() override {
+        auto prim = get_input<PrimitiveObject>("prim");
+        auto collider = get_input<BlenderCollider>("collider");
+        auto sdf_attr = get_param<std::string>("sdf_attr");
+        auto push_out = get_param<bool>("push_out");
+        auto thickness = get_param<float>("thickness");
+
+        float m[3][4], inv[3][4];
+        for (int r = 0; r < 3; r++) {
+            for (int c = 0; c < 4; c++) {
+                m[r][c] = collider->matrix[r][c];
+            }
+        }
+        affine_inverse(m, inv);
+
+        // distance to the closest triangle, signed by the side of that
+        // triangle the point is on (approximate next to sharp edges)
+        auto &pos = prim->attr<vec3f>("pos");
+        auto &sdf = prim->add_attr<float>(sdf_attr);
+        #pragma omp parallel for
+        for (int i = 0; i < pos.size(); i++) {
+            vec3f closest;
+            int t = collider->closest_point(transform_point(inv, pos[i]), closest);
+            if (t < 0) {
+                sdf[i] = std::numeric_limits<float>::infinity();
+                continue;
+            }
+            auto const &tri = collider->tris[t];
+            auto a = transform_point(m, collider->vert[tri[0]]);
+            auto b = transform_point(m, collider->vert[tri[1]]);
+            auto c = transform_point(m, collider->vert[tri[2]]);
+            auto nrm = cross(b - a, c - a);
+            float len = length(nrm);
+            nrm = len > 0 ? nrm / len : vec3f(0, 0, 1);
+
+            auto q = transform_point(m, closest);
+            auto d = pos[i] - q;
+            float dist = length(d);
+            sdf[i] = dot(d, nrm) < 0 ? -dist : dist;
+            if (push_out && sdf[i] < thickness) {
+                pos[i] = q + nrm * thickness;
+            }
+        }
+
+        set_output("prim", std::move(prim));
+    }
+};
+
+ZENDEFNODE(BlenderColliderProject, {
+    {"prim", "collider"},
+    {"prim"},
+    {
+    {"string", "sdf_attr", "sdf"},
+    {"bool", "push_out", "0"},
+    {"float", "thickness", "0"},
+    },
+    {"blender"},
+});
+
+}
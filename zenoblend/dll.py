@@ -14,28 +14,98 @@ if os_name == 'win32':  # windows doesn't support rpath, let's mock him only
 
 from .bin import pylib_zenoblend as core
 
-def loadAutoloads(lib_dir):
-    #print('loading addons from', lib_dir)
-    if not os.path.isdir(lib_dir):
-        return
-
-    paths = []
-    for name in os.listdir(lib_dir):
-        path = os.path.join(lib_dir, name)
-        if os.path.islink(path):
-            continue
-        if os_name == 'win32':
-            if name.startswith('zeno_') and name.endswith('.dll'):
-                paths.append(name)
-        elif os_name == 'darwin':
-            if name.startswith('libzeno_') and name.endswith('.dylib'):
-                paths.append(name)
+def readNeeded(path):
+    '''Names in the DT_NEEDED entries of an ELF shared library, None if not ELF'''
+    import struct
+    with open(path, 'rb') as f:
+        ident = f.read(16)
+        if ident[:4] != b'\x7fELF':
+            return None
+        is64 = ident[4] == 2
+        end = '<' if ident[5] == 1 else '>'
+        if is64:
+            f.seek(0x28)
+            shoff, = struct.unpack(end + 'Q', f.read(8))
+            f.seek(0x3a)
+            shentsize, shnum = struct.unpack(end + 'HH', f.read(4))
         else:
-            if name.startswith('libzeno_') and name.endswith('.so'):
-                paths.append(path)
+            f.seek(0x20)
+            shoff, = struct.unpack(end + 'I', f.read(4))
+            f.seek(0x2e)
+            shentsize, shnum = struct.unpack(end + 'HH', f.read(4))
 
-    #print('to be loaded:', paths)
+        sections = []
+        for i in range(shnum):
+            f.seek(shoff + i * shentsize)
+            if is64:
+                _, type, _, _, offset, size, link = struct.unpack(end + 'IIQQQQI', f.read(44))
+            else:
+                _, type, _, _, offset, size, link = struct.unpack(end + 'IIIIIII', f.read(28))
+            sections.append((type, offset, size, link))
+
+        needed = []
+        for type, offset, size, link in sections:
+            if type != 6:  # SHT_DYNAMIC
+                continue
+            f.seek(sections[link][1])
+            strtab = f.read(sections[link][2])
+            f.seek(offset)
+            data = f.read(size)
+            fmt, entsize = (end + 'qQ', 16) if is64 else (end + 'iI', 8)
+            for k in range(0, len(data) - entsize + 1, entsize):
+                tag, val = struct.unpack_from(fmt, data, k)
+                if tag == 0:  # DT_NULL
+                    break
+                if tag == 1:  # DT_NEEDED
+                    needed.append(strtab[val:strtab.index(b'\0', val)].decode())
+        return needed
+
+
+def sortByDependencies(paths):
+    '''Order paths so each library comes after the ones it links to, None if unknown'''
+    byName = {os.path.basename(path): path for path in paths}
+    deps = {}
+    for path in paths:
+        try:
+            needed = readNeeded(path)
+        except (OSError, ValueError, IndexError):
+            needed = None
+        if needed is None:
+            return None
+        deps[path] = [byName[name] for name in needed if name in byName and byName[name] != path]
+
+    order = []
+    state = {}
+    def visit(path):
+        if state.get(path) == 'done':
+            return True
+        if state.get(path) == 'visiting':
+            return False  # cyclic, leave it to the retry loop
+        state[path] = 'visiting'
+        if not all(visit(dep) for dep in deps[path]):
+            return False
+        state[path] = 'done'
+        order.append(path)
+        return True
+    for path in paths:
+        if not visit(path):
+            return None
+    return order, deps
 
+
+def loadLibrary(path):
+    try:
+        print('[      ] [{}]'.format(path))
+        ctypes.cdll.LoadLibrary(path)
+    except OSError:
+        print('[FAILED] [{}]'.format(path))
+        traceback.print_exc()
+        return False
+    print('[  OK  ] [{}]'.format(path))
+    return True
+
+
+def loadWithRetries(paths):
     retries = {}
     max_retries = len(paths) + 2
     while paths:
@@ -55,7 +125,131 @@ def loadAutoloads(lib_dir):
             else:
                 print('[  OK  ] [{}]'.format(path))
 
-if not os.environ.get('ZEN_NOAUTOLOAD'):
+
+def listAutoloads(lib_dir):
+    if not os.path.isdir(lib_dir):
+        return []
+
+    paths = []
+    for name in sorted(os.listdir(lib_dir)):
+        path = os.path.join(lib_dir, name)
+        if os.path.islink(path):
+            continue
+        if os_name == 'win32':
+            if name.startswith('zeno_') and name.endswith('.dll'):
+                paths.append(name)
+        elif os_name == 'darwin':
+            if name.startswith('libzeno_') and name.endswith('.dylib'):
+                paths.append(name)
+        else:
+            if name.startswith('libzeno_') and name.endswith('.so'):
+                paths.append(path)
+    return paths
+
+
+def loadAutoloads(lib_dir):
+    #print('loading addons from', lib_dir)
+    paths = listAutoloads(lib_dir)
+    #print('to be loaded:', paths)
+
+    # one pass in link order where DT_NEEDED can be read (ELF), otherwise
+    # retry the failing ones until their dependencies got loaded
+    sorted_paths = sortByDependencies(paths) if os_name not in ('win32', 'darwin') else None
+    if sorted_paths is None:
+        loadWithRetries(paths)
+        return
+    for path in sorted_paths[0]:
+        loadLibrary(path)
+
+
+# ZEN_LAZYLOAD=1: load an extension only once a scene uses one of its node
+# types. The descriptors of the nodes each library defines are recorded in a
+# manifest, built by loading them all once, again whenever a library changes
+lazyLibs = {}  # path -> (node types, dependency paths), of the libraries not loaded yet
+lazyDescriptors = {}  # path -> node descriptors, of the libraries not loaded yet
+
+
+def getManifestPath():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'zenoblend', 'plugins.json')
+
+
+def loadLazily(lib_dir):
+    import json
+    paths = listAutoloads(lib_dir)
+    sorted_paths = sortByDependencies(paths) if os_name not in ('win32', 'darwin') else None
+    if sorted_paths is None:
+        print('[ LAZY ] dependencies unknown, loading everything')
+        loadWithRetries(paths)
+        return
+    order, deps = sorted_paths
+
+    key = [[os.path.basename(path), os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in order]
+    manifest_path = getManifestPath()
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['key'] != key or 'descriptors' not in manifest:
+            manifest = None
+    except (OSError, ValueError, KeyError):
+        manifest = None
+
+    if manifest is None:
+        descriptors = {}
+        generation, _ = core.getDescriptors(0)
+        for path in order:
+            loadLibrary(path)
+            generation, descriptors[os.path.basename(path)] = core.getDescriptors(generation)
+        try:
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+            with open(manifest_path, 'w') as f:
+                json.dump({'key': key, 'descriptors': descriptors}, f)
+        except OSError as e:
+            print('WARNING: cannot write plugin manifest:', e)
+        return
+
+    for path in order:
+        descriptors = manifest['descriptors'].get(os.path.basename(path), [])
+        lazyLibs[path] = {desc[0] for desc in descriptors}, deps[path]
+        lazyDescriptors[path] = descriptors
+
+
+def requireLibrary(path):
+    if path not in lazyLibs:
+        return
+    nodes, deps = lazyLibs.pop(path)
+    lazyDescriptors.pop(path)
+    for dep in deps:
+        requireLibrary(dep)
+    loadLibrary(path)
+
+
+def requireNodeTypes(nodeTypes):
+    '''Load the deferred libraries defining any of nodeTypes'''
+    for path, (nodes, deps) in list(lazyLibs.items()):
+        if nodes & nodeTypes:
+            requireLibrary(path)
+
+
+def requireScene(jsonStr):
+    '''Load the deferred libraries the node types of a dumped scene need'''
+    if not lazyLibs:
+        return
+    import json
+    commands = json.loads(jsonStr)
+    requireNodeTypes({command[1] for command in commands if command[0] == 'addNode'})
+
+
+def deferredDescriptors():
+    '''Node descriptors of the libraries not loaded yet, as recorded in the manifest'''
+    return [desc for descriptors in lazyDescriptors.values() for desc in descriptors]
+
+
+if os.environ.get('ZEN_NOAUTOLOAD'):
+    pass
+elif os.environ.get('ZEN_LAZYLOAD'):
+    loadLazily(relative_path('bin'))
+else:
     loadAutoloads(relative_path('bin'))
 
 __all__ = ['core']
@@ -41,6 +41,36 @@ class ZenoStopOperator(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class ZenoCaptureOperator(bpy.types.Operator):
+    """Capture the current tree and frame into a bundle replayable without Blender"""
+    bl_idname = "node.zeno_capture"
+    bl_label = "Capture Bundle"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default='*.npz', options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, context):
+        return getattr(context.space_data, 'edit_tree', None) is not None \
+                and context.space_data.tree_type == 'ZenoNodeTree'
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = bpy.path.abspath('//') + 'zeno_bundle_{}.npz'.format(context.scene.frame_current)
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        tree = context.space_data.edit_tree
+        if not tree.zeno_enabled:
+            self.report({'ERROR'}, 'Tree {} is disabled, enable it to capture'.format(tree.name))
+            return {'CANCELLED'}
+        graph_name = tree.name
+        scenario.capture_bundle(graph_name, self.filepath)
+        self.report({'INFO'}, 'Bundle written to {}'.format(self.filepath))
+        return {'FINISHED'}
+
+
 class ZenoReloadOperator(bpy.types.Operator):
     """Reload Zeno graphs"""
     bl_idname = "node.zeno_reload"
@@ -51,7 +81,8 @@ class ZenoReloadOperator(bpy.types.Operator):
         return context.space_data.tree_type == 'ZenoNodeTree'
 
     def execute(self, context):
-        from .node_system import init_node_subgraphs, deinit_node_subgraphs
+        from .node_system import init_node_subgraphs, deinit_node_subgraphs, add_new_node_classes
+        add_new_node_classes()
         deinit_node_subgraphs()
         init_node_subgraphs()
         reinit_subgraph_sockets()
@@ -65,6 +96,7 @@ def draw_menu(self, context):
         self.layout.operator("node.zeno_start", text="Start Zeno Instance")
         self.layout.operator("node.zeno_stop", text="Stop Zeno Instance")
         self.layout.operator("node.zeno_reload", text="Reload Graph Nodes")
+        self.layout.operator("node.zeno_capture", text="Capture Zeno Bundle")
 
 
 def update_node_tree_list(self, context):
@@ -78,6 +110,14 @@ def update_node_tree_list(self, context):
 class ZenoSceneProperties(bpy.types.PropertyGroup):
     frame_start: bpy.props.IntProperty(name='Start', default=1)
     frame_end: bpy.props.IntProperty(name='End', default=1000)
+    cache_dir: bpy.props.StringProperty(name='Cache', default='//zeno_cache/', subtype='DIR_PATH',
+            description='Directory of the per-frame cache files, like .vdb volumes')
+    inline_subgraphs: bpy.props.BoolProperty(name='Inline Subgraphs', default=False,
+            description='Flatten subgraphs into their callers when loading the trees, caching unchanged ones')
+    share_common_nodes: bpy.props.BoolProperty(name='Share Common Nodes', default=False,
+            description='Evaluate node chains found identically in several uncached trees only once per update')
+    unshared_nodes: bpy.props.StringProperty(name='Unshared Nodes', default='',
+            description='Space-separated node types never shared, like solvers keeping state across frames')
     ui_list_selected_tree: bpy.props.IntProperty(update=update_node_tree_list)
    
 
@@ -107,10 +147,11 @@ class ZENO_UL_TreePropertyList(bpy.types.UIList):
         # buttons
         row = row.row(align=True)
         row.alignment = 'RIGHT'
-        row.ui_units_x = 3
+        row.ui_units_x = 4
         row.prop(tree, 'zeno_enabled', icon='RESTRICT_VIEW_' + ('OFF' if tree.zeno_enabled else 'ON'), text='')#, emboss=False)
         row.prop(tree, 'zeno_realtime_update', icon='FILE_REFRESH', text='')
         row.prop(tree, 'zeno_cached', icon='PHYSICS', text='')
+        row.prop(tree, 'zeno_preview', icon='MOD_DECIM', text='')
 
     def filter_items(self, context, data, prop_name):
         trees = getattr(data, prop_name)
@@ -158,6 +199,11 @@ class ZenoScenePanel(bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(scene.zeno, 'frame_start')
         row.prop(scene.zeno, 'frame_end')
+        layout.prop(scene.zeno, 'cache_dir')
+        layout.prop(scene.zeno, 'inline_subgraphs')
+        layout.prop(scene.zeno, 'share_common_nodes')
+        if scene.zeno.share_common_nodes:
+            layout.prop(scene.zeno, 'unshared_nodes')
         col = layout.column()
         tree_id = scene.zeno.ui_list_selected_tree
         if tree_id >= 0:
@@ -165,6 +211,8 @@ class ZenoScenePanel(bpy.types.Panel):
             if tree.zeno_cached:
                 cached_to_frame = tree.nextFrameId - 1 if getattr(tree, "nextFrameId", None) else '(no cache)'
                 col.label(text=f"Cached to frame: {cached_to_frame}")
+            elif tree.zeno_preview:
+                col.prop(tree, 'zeno_preview_resolution')
         row = layout.row()
         row.operator('node.zeno_start')
         row.operator('node.zeno_stop')
@@ -174,6 +222,7 @@ classes = (
     ZenoStartOperator,
     ZenoStopOperator,
     ZenoReloadOperator,
+    ZenoCaptureOperator,
     ZenoSceneProperties,
     ZENO_UL_TreePropertyList,
     ZenoScenePanel,
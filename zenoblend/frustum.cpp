@@ -0,0 +1,117 @@
+#include <zeno/zeno.h>
+#include "BlenderMesh.h"
+#include <zeno/types/PrimitiveObject.h>
+#include <cmath>
+
+namespace {
+using namespace zeno;
+
+
+// keep the entries of arr listed in `kept`, which is sorted, attributes included
+template <class T>
+static void compact(AttrVector<T> &arr, std::vector<int> const &kept) {
+    for (int i = 0; i < kept.size(); i++) {
+        arr.values[i] = arr.values[kept[i]];
+    }
+    arr.foreach_attr([&] (auto const &key, auto &attr) {
+        for (int i = 0; i < kept.size(); i++) {
+            attr[i] = attr[kept[i]];
+        }
+    });
+    arr.resize(kept.size());
+}
+
+// remap the vertex indices of each element, dropping the ones using a culled vertex
+template <class T, class F>
+static void cull_elements(AttrVector<T> &arr, std::vector<int> const &remap, F &&vertices_of) {
+    std::vector<int> kept;
+    for (int i = 0; i < arr.size(); i++) {
+        bool inside = true;
+        vertices_of(arr[i], [&] (int &v) {
+            inside = inside && remap[v] >= 0;
+        });
+        if (inside) {
+            vertices_of(arr[i], [&] (int &v) {
+                v = remap[v];
+            });
+            kept.push_back(i);
+        }
+    }
+    compact(arr, kept);
+}
+
+
+struct BlenderFrustumCull : INode {
+    virtual void apply() override {
+        auto prim = get_input<PrimitiveObject>("prim");
+        auto camera = get_input<BlenderCamera>("camera");
+        auto margin = get_param<float>("margin");
+        auto const &vp = camera->view_projection;
+
+        // a point is visible when its clip coordinates lie within +-w, the
+        // margin widens the sides so objects centered just outside still show
+        auto &pos = prim->attr<vec3f>("pos");
+        std::vector<char> inside(pos.size());
+        #pragma omp parallel for
+        for (int i = 0; i < pos.size(); i++) {
+            auto p = pos[i];
+            float c[4];
+            for (int r = 0; r < 4; r++) {
+                c[r] = vp[r][0] * p[0] + vp[r][1] * p[1] + vp[r][2] * p[2] + vp[r][3];
+            }
+            float w = c[3], side = w * (1 + margin);
+            inside[i] = w > 0 && std::abs(c[0]) <= side && std::abs(c[1]) <= side
+                && std::abs(c[2]) <= w;
+        }
+
+        std::vector<int> remap(pos.size(), -1), kept;
+        for (int i = 0; i < pos.size(); i++) {
+            if (inside[i]) {
+                remap[i] = kept.size();
+                kept.push_back(i);
+            }
+        }
+        compact(prim->verts, kept);
+
+        cull_elements(prim->points, remap, [] (int &e, auto &&f) { f(e); });
+        cull_elements(prim->lines, remap, [] (vec2i &e, auto &&f) { f(e[0]); f(e[1]); });
+        cull_elements(prim->tris, remap, [] (vec3i &e, auto &&f) { f(e[0]); f(e[1]); f(e[2]); });
+        cull_elements(prim->quads, remap, [] (vec4i &e, auto &&f) {
+            f(e[0]); f(e[1]); f(e[2]); f(e[3]);
+        });
+
+        if (prim->polys.size()) {
+            std::vector<int> kept_polys, kept_loops;
+            for (int i = 0; i < prim->polys.size(); i++) {
+                auto [start, len] = prim->polys[i];
+                bool all_inside = true;
+                for (int l = start; l < start + len; l++) {
+                    all_inside = all_inside && remap[prim->loops[l]] >= 0;
+                }
+                if (!all_inside)
+                    continue;
+                prim->polys[i] = {(int)kept_loops.size(), len};
+                for (int l = start; l < start + len; l++) {
+                    kept_loops.push_back(l);
+                }
+                kept_polys.push_back(i);
+            }
+            compact(prim->loops, kept_loops);
+            for (auto &v: prim->loops.values) {
+                v = remap[v];
+            }
+            compact(prim->polys, kept_polys);
+        }
+
+        set_output("prim", std::move(prim));
+    }
+};
+
+ZENDEFNODE(BlenderFrustumCull, {
+    {"prim", "camera"},
+    {"prim"},
+    {{"float", "margin", "0.1"}},
+    {"blender"},
+});
+
+}
@@ -4,15 +4,161 @@
 #include <zeno/types/NumericObject.h>
 #include <zeno/types/StringObject.h>
 #include <zeno/utils/safe_at.h>
+#include <algorithm>
+#include <cstdio>
+#include <filesystem>
+#include <fstream>
+#include <numeric>
+#include <sstream>
+#include <stdexcept>
+#include <type_traits>
 
 namespace {
 using namespace zeno;
 
 
+// triangulate a (possibly concave) polygon by ear clipping in its projected plane,
+// always emits exactly len - 2 triangles into tris
+static void ear_clip_polygon(std::vector<vec3f> const &vert, int const *loop, int len, vec3i *tris) {
+    vec3f nrm(0, 0, 0);
+    for (int j = 0; j < len; j++) {
+        auto p = vert[loop[j]], q = vert[loop[(j + 1) % len]];
+        nrm[0] += (p[1] - q[1]) * (p[2] + q[2]);
+        nrm[1] += (p[2] - q[2]) * (p[0] + q[0]);
+        nrm[2] += (p[0] - q[0]) * (p[1] + q[1]);
+    }
+    int axis = 0;
+    for (int k = 1; k < 3; k++) {
+        if (std::abs(nrm[k]) > std::abs(nrm[axis]))
+            axis = k;
+    }
+    int u = (axis + 1) % 3, v = (axis + 2) % 3;
+    if (nrm[axis] < 0)
+        std::swap(u, v);
+
+    std::vector<vec2f> pts(len);
+    for (int j = 0; j < len; j++) {
+        auto p = vert[loop[j]];
+        pts[j] = vec2f(p[u], p[v]);
+    }
+    auto cross = [&] (int a, int b, int c) {
+        auto ab = pts[b] - pts[a], ac = pts[c] - pts[a];
+        return ab[0] * ac[1] - ab[1] * ac[0];
+    };
+
+    std::vector<int> idx(len);
+    std::iota(idx.begin(), idx.end(), 0);
+    int ntris = 0;
+    while (idx.size() > 3) {
+        int n = idx.size();
+        bool clipped = false;
+        for (int k = 0; k < n; k++) {
+            int a = idx[(k + n - 1) % n], b = idx[k], c = idx[(k + 1) % n];
+            if (cross(a, b, c) <= 0)
+                continue;  // reflex corner
+            bool inside = false;
+            for (int t: idx) {
+                if (t == a || t == b || t == c)
+                    continue;
+                if (cross(a, b, t) >= 0 && cross(b, c, t) >= 0 && cross(c, a, t) >= 0) {
+                    inside = true;
+                    break;
+                }
+            }
+            if (inside)
+                continue;
+            tris[ntris++] = vec3i(loop[a], loop[b], loop[c]);
+            idx.erase(idx.begin() + k);
+            clipped = true;
+            break;
+        }
+        if (!clipped)  // degenerate or self-intersecting, fan the remaining part
+            break;
+    }
+    for (int k = 1; k + 1 < idx.size(); k++) {
+        tris[ntris++] = vec3i(loop[idx[0]], loop[idx[k]], loop[idx[k + 1]]);
+    }
+}
+
+
+
+// derive the unique edges of all polygons, merged with the existing loose edges,
+// and the edge index of every loop; edges are bucketed by their lower vertex
+// index so that each bucket can be deduplicated independently in parallel
+static void derive_edges(BlenderMesh *mesh, int nverts) {
+    int nloops = mesh->loop.size();
+    int nentries = nloops + mesh->edge.size();
+
+    std::vector<std::pair<int, int>> keys(nentries);
+    #pragma omp parallel for
+    for (int i = 0; i < mesh->poly.size(); i++) {
+        auto [start, len] = mesh->poly[i];
+        for (int j = 0; j < len; j++) {
+            int a = mesh->loop[start + j];
+            int b = mesh->loop[start + (j + 1) % len];
+            keys[start + j] = {std::min(a, b), std::max(a, b)};
+        }
+    }
+    #pragma omp parallel for
+    for (int i = 0; i < mesh->edge.size(); i++) {
+        auto [src, dst] = mesh->edge[i];
+        keys[nloops + i] = {std::min(src, dst), std::max(src, dst)};
+    }
+
+    std::vector<int> offset(nverts + 1, 0);
+    #pragma omp parallel for
+    for (int i = 0; i < nentries; i++) {
+        #pragma omp atomic
+        offset[keys[i].first + 1]++;
+    }
+    std::partial_sum(offset.begin(), offset.end(), offset.begin());
+
+    std::vector<int> cursor(offset.begin(), offset.end() - 1);
+    std::vector<std::pair<int, int>> bucket(nentries);  // (hi, entry)
+    #pragma omp parallel for
+    for (int i = 0; i < nentries; i++) {
+        int slot;
+        #pragma omp atomic capture
+        slot = cursor[keys[i].first]++;
+        bucket[slot] = {keys[i].second, i};
+    }
+
+    std::vector<int> edge_offset(nverts + 1, 0);
+    #pragma omp parallel for
+    for (int v = 0; v < nverts; v++) {
+        auto begin = bucket.begin() + offset[v], end = bucket.begin() + offset[v + 1];
+        std::sort(begin, end);
+        int nuniq = 0;
+        for (auto it = begin; it != end; ++it) {
+            if (it == begin || it->first != (it - 1)->first)
+                nuniq++;
+        }
+        edge_offset[v + 1] = nuniq;
+    }
+    std::partial_sum(edge_offset.begin(), edge_offset.end(), edge_offset.begin());
+
+    mesh->edge.resize(edge_offset[nverts]);
+    mesh->loop_edge.resize(nloops);
+    #pragma omp parallel for
+    for (int v = 0; v < nverts; v++) {
+        int id = edge_offset[v] - 1;
+        for (int k = offset[v]; k < offset[v + 1]; k++) {
+            auto [hi, entry] = bucket[k];
+            if (k == offset[v] || hi != bucket[k - 1].first)
+                mesh->edge[++id] = {v, hi};
+            if (entry < nloops)
+                mesh->loop_edge[entry] = id;
+        }
+    }
+}
+
 
 struct BlenderInputText : INode {
     virtual void apply() override {
         auto text = get_input2<std::string>("text");
+        // older scenes and hand written ones pass the text itself
+        if (text.rfind("zenotext:", 0) == 0)
+            text = safe_at(text_bodies(), text, "text body");
         set_output2("value", std::move(text));
     }
 };
@@ -25,11 +171,109 @@ ZENDEFNODE(BlenderInputText, {
 });
 
 
+struct BlenderInputImage : INode {
+    virtual void complete() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        ud.image_names.insert(get_input2<std::string>("image"));
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto image = safe_at(ud.images, get_input2<std::string>("image"), "blender image");
+        int width = image->width, height = image->height, channels = image->channels;
+        auto const *pixels = image->pixels.data();
+
+        // one point per pixel center, in uv space
+        auto prim = std::make_shared<PrimitiveObject>();
+        prim->resize(width * height);
+        auto &pos = prim->add_attr<vec3f>("pos");
+        auto &clr = prim->add_attr<vec3f>("clr");
+        #pragma omp parallel for
+        for (int i = 0; i < width * height; i++) {
+            int x = i % width, y = i / width;
+            pos[i] = vec3f((x + 0.5f) / width, (y + 0.5f) / height, 0);
+            auto const *p = pixels + i * channels;
+            clr[i] = channels >= 3 ? vec3f(p[0], p[1], p[2]) : vec3f(p[0]);
+        }
+        if (channels == 4 || channels == 2) {
+            auto &alpha = prim->add_attr<float>("alpha");
+            #pragma omp parallel for
+            for (int i = 0; i < width * height; i++) {
+                alpha[i] = pixels[i * channels + channels - 1];
+            }
+        }
+
+        set_output("prim", std::move(prim));
+        set_output2("width", width);
+        set_output2("height", height);
+    }
+};
+
+ZENDEFNODE(BlenderInputImage, {
+    {},
+    {"prim", {"int", "width"}, {"int", "height"}},
+    {},
+    {"blender"},
+});
+
+struct BlenderPreview : INode {
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        set_output2("preview", (int)(ud.preview_resolution > 0));
+        set_output2("resolution", ud.preview_resolution);
+    }
+};
+
+ZENDEFNODE(BlenderPreview, {
+    {},
+    {{"int", "preview"}, {"int", "resolution"}},
+    {},
+    {"blender"},
+});
+
+
+struct BlenderSharedExport : INode {
+    virtual void complete() override {
+        graph->finalOutputNodes.insert(myname);
+    }
+
+    virtual void apply() override {
+        auto key = get_input2<std::string>("key");
+        shared_objects()[graph->scene][key] = get_input("object");
+    }
+};
+
+ZENDEFNODE(BlenderSharedExport, {
+    {"object", {"string", "key", ""}},
+    {},
+    {},
+    {"blender"},
+});
+
+
+struct BlenderSharedImport : INode {
+    virtual void apply() override {
+        auto key = get_input2<std::string>("key");
+        auto const &objects = shared_objects()[graph->scene];
+        // every importing tree gets its own copy to modify
+        set_output("object", safe_at(objects, key, "shared object")->clone());
+    }
+};
+
+ZENDEFNODE(BlenderSharedImport, {
+    {{"string", "key", ""}},
+    {"object"},
+    {},
+    {"blender"},
+});
+
+
 struct BlenderInputAxes : INode {
     virtual void complete() override {
         auto &ud = graph->getUserData().get<BlenderData>("blender_data");
         auto objid = get_input2<std::string>("objid");
         ud.input_names.insert(objid);
+        ud.input_components[objid].insert("matrix");
     }
 
     virtual void apply() override {
@@ -66,46 +310,87 @@ ZENDEFNODE(BlenderInputAxes, {
 });
 
 
-struct BlenderInputPrimitive : INode {
+struct BlenderInputCamera : INode {
     virtual void complete() override {
         auto &ud = graph->getUserData().get<BlenderData>("blender_data");
         auto objid = get_input2<std::string>("objid");
         ud.input_names.insert(objid);
+        ud.input_components[objid].insert("camera");
     }
 
     virtual void apply() override {
         auto &ud = graph->getUserData().get<BlenderData>("blender_data");
         auto objid = get_input2<std::string>("objid");
-        auto object = safe_at(ud.inputs, objid, "blender input")();
+        auto camera = safe_dynamic_cast<BlenderCamera>(
+                safe_at(ud.inputs, objid, "blender input")(), "blender camera");
 
-        auto mesh = safe_dynamic_cast<BlenderMesh>(object);
+        auto m = camera->matrix;
+        set_output2("origin", vec3f(m[0][3], m[1][3], m[2][3]));
+        // blender cameras look down their local -Z axis, with +Y up
+        set_output2("direction", vec3f(-m[0][2], -m[1][2], -m[2][2]));
+        set_output2("up", vec3f(m[0][1], m[1][1], m[2][1]));
+        set_output2("resolution", vec2i(camera->width, camera->height));
+        set_output2("clip_range", vec2f(camera->clip_start, camera->clip_end));
+        set_output2("frame", ud.frame);
+        set_output("camera", std::move(camera));
+    }
+};
+
+ZENDEFNODE(BlenderInputCamera, {
+    {},
+    {
+    "camera",
+    {"vec3f", "origin"},
+    {"vec3f", "direction"},
+    {"vec3f", "up"},
+    {"vec2i", "resolution"},
+    {"vec2f", "clip_range"},
+    {"int", "frame"},
+    },
+    {},
+    {"blender"},
+});
+
+struct BlenderInputPrimitive : INode {
+    virtual void complete() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+        ud.input_names.insert(objid);
+        auto &components = ud.input_components[objid];
+        components.insert("matrix");
+        components.insert("vert");
+        if (get_param<bool>("has_edges"))
+            components.insert("edge");
+        if (get_param<bool>("has_faces"))
+            components.insert("poly");
+    }
+
+    // the primitive in the mesh's local space, taking its vertex buffer over
+    // if `steal_vert`
+    std::shared_ptr<PrimitiveObject> convert(BlenderMesh *mesh, bool steal_vert) {
         auto prim = std::make_shared<PrimitiveObject>();
         auto allow_quads = get_param<bool>("allow_quads");
-        auto do_transform = get_param<bool>("do_transform");
         auto has_edges = get_param<bool>("has_edges");
         auto has_faces = get_param<bool>("has_faces");
 
-        // todo: support **input** blender attributes
-        prim->resize(mesh->vert.size());
+        auto const &vert = mesh->verts();
+        prim->resize(vert.size());
         auto &pos = prim->add_attr<vec3f>("pos");
-        if (do_transform) {
-            auto m = mesh->matrix;
-            #pragma omp parallel for
-            for (int i = 0; i < mesh->vert.size(); i++) {
-                auto p = mesh->vert[i];
-                p = {
-                    m[0][0] * p[0] + m[0][1] * p[1] + m[0][2] * p[2] + m[0][3],
-                    m[1][0] * p[0] + m[1][1] * p[1] + m[1][2] * p[2] + m[1][3],
-                    m[2][0] * p[0] + m[2][1] * p[1] + m[2][2] * p[2] + m[2][3],
-                };
-                pos[i] = p;
-            }
+        if (steal_vert) {
+            // the mesh doesn't borrow it back, nodes downstream may modify
+            // the primitive in place
+            pos = std::move(mesh->vert.values);
+            mesh->vert.values.clear();
         } else {
-            for (int i = 0; i < mesh->vert.size(); i++) {
-                pos[i] = mesh->vert[i];
-            }
+            pos = vert.values;
         }
 
+        // vertex attributes given along with the input (see graphSetInputVertAttr)
+        mesh->vert.foreach_attr([&] (auto const &key, auto const &attr) {
+            using T = std::decay_t<decltype(attr[0])>;
+            prim->add_attr<T>(key) = attr;
+        });
+
         if (has_edges) {
             for (int i = 0; i < mesh->edge.size(); i++) {
                 auto [src, dst] = mesh->edge[i];
@@ -113,24 +398,59 @@ struct BlenderInputPrimitive : INode {
             }
         }
 
-        if (has_faces) {
+        if (has_faces && get_param<bool>("keep_polys")) {
+            prim->loops.resize(mesh->loop.size());
+            #pragma omp parallel for
+            for (int i = 0; i < mesh->loop.size(); i++) {
+                prim->loops[i] = mesh->loop[i];
+            }
+            prim->polys.resize(mesh->poly.size());
+            #pragma omp parallel for
             for (int i = 0; i < mesh->poly.size(); i++) {
                 auto [start, len] = mesh->poly[i];
-                if (len < 3) continue;
-                if (len == 4 && allow_quads) {
-                    prim->quads.emplace_back(
+                prim->polys[i] = {start, len};
+            }
+
+        } else if (has_faces) {
+            auto ear_clip = get_param<bool>("ear_clip");
+            int npolys = mesh->poly.size();
+
+            // first pass: count the faces of each polygon, then prefix sum to offsets
+            std::vector<int> tri_offset(npolys + 1), quad_offset(npolys + 1);
+            tri_offset[0] = quad_offset[0] = 0;
+            #pragma omp parallel for
+            for (int i = 0; i < npolys; i++) {
+                auto len = mesh->poly[i].len;
+                bool is_quad = len == 4 && allow_quads;
+                tri_offset[i + 1] = len < 3 || is_quad ? 0 : len - 2;
+                quad_offset[i + 1] = is_quad ? 1 : 0;
+            }
+            std::partial_sum(tri_offset.begin(), tri_offset.end(), tri_offset.begin());
+            std::partial_sum(quad_offset.begin(), quad_offset.end(), quad_offset.begin());
+            prim->tris.resize(tri_offset[npolys]);
+            prim->quads.resize(quad_offset[npolys]);
+
+            // second pass: fill each polygon's faces at its own offset
+            #pragma omp parallel for
+            for (int i = 0; i < npolys; i++) {
+                auto [start, len] = mesh->poly[i];
+                if (quad_offset[i + 1] != quad_offset[i]) {
+                    prim->quads[quad_offset[i]] = vec4i(
                             mesh->loop[start + 0],
                             mesh->loop[start + 1],
                             mesh->loop[start + 2],
                             mesh->loop[start + 3]);
                     continue;
                 }
-                prim->tris.emplace_back(
-                        mesh->loop[start + 0],
-                        mesh->loop[start + 1],
-                        mesh->loop[start + 2]);
-                for (int j = 3; j < len; j++) {
-                    prim->tris.emplace_back(
+                if (len < 3) continue;
+                auto *tris = prim->tris.values.data() + tri_offset[i];
+                if (ear_clip && len > 3) {
+                    // the primitive's positions, the mesh may have handed them over
+                    ear_clip_polygon(pos, &mesh->loop[start], len, tris);
+                    continue;
+                }
+                for (int j = 2; j < len; j++) {
+                    tris[j - 2] = vec3i(
                             mesh->loop[start + 0],
                             mesh->loop[start + j - 1],
                             mesh->loop[start + j]);
@@ -138,8 +458,50 @@ struct BlenderInputPrimitive : INode {
             }
         }
 
+        return prim;
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+        auto object = safe_at(ud.inputs, objid, "blender input")();
+
+        auto mesh = safe_dynamic_cast<BlenderMesh>(object);
+        object = nullptr;
+        std::shared_ptr<PrimitiveObject> prim;
+        if (is_pooled(ud.input_cache, objid, mesh)) {
+            // an unchanged geometry revision hands back the same cached mesh,
+            // whose conversion is then reused: only the matrix is applied
+            // again, to a copy nodes downstream may modify
+            auto &[source, local] = ud.input_prims[myname];
+            if (!local || source.lock() != mesh) {
+                local = convert(mesh.get(), false);
+                source = mesh;
+            }
+            prim = std::static_pointer_cast<PrimitiveObject>(local->clone());
+        } else {
+            // nobody else holds this mesh but the pool, which refills it
+            // before its next use: hand its vertex buffer over, no copy
+            bool steal_vert = mesh.use_count() == 1 + is_pooled(ud.input_pool, objid, mesh)
+                && !mesh->shared_vert;
+            prim = convert(mesh.get(), steal_vert);
+        }
+
+        if (get_param<bool>("do_transform")) {
+            auto m = mesh->matrix;
+            auto &pos = prim->attr<vec3f>("pos");
+            #pragma omp parallel for
+            for (int i = 0; i < pos.size(); i++) {
+                auto p = pos[i];
+                pos[i] = {
+                    m[0][0] * p[0] + m[0][1] * p[1] + m[0][2] * p[2] + m[0][3],
+                    m[1][0] * p[0] + m[1][1] * p[1] + m[1][2] * p[2] + m[1][3],
+                    m[2][0] * p[0] + m[2][1] * p[1] + m[2][2] * p[2] + m[2][3],
+                };
+            }
+        }
+
         set_output("prim", std::move(prim));
-        set_output2("object", std::move(object));
     }
 };
 
@@ -151,11 +513,118 @@ ZENDEFNODE(BlenderInputPrimitive, {
     {"bool", "do_transform", "1"},
     {"bool", "has_edges", "0"},
     {"bool", "has_faces", "1"},
+    {"bool", "ear_clip", "0"},
+    {"bool", "keep_polys", "0"},
     },
     {"blender"},
 });
 
 
+struct BlenderInputCollider : INode {
+    virtual void complete() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+        ud.input_names.insert(objid);
+        auto &components = ud.input_components[objid];
+        components.insert("matrix");
+        components.insert("vert");
+        components.insert("poly");
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+        auto mesh = safe_dynamic_cast<BlenderMesh>(safe_at(ud.inputs, objid, "blender input")());
+
+        // an unchanged geometry revision hands back the same cached mesh, whose
+        // collider and bvh are then reused as is, with only the matrix updated
+        auto &[source, collider] = ud.colliders[objid];
+        bool is_cached = is_pooled(ud.input_cache, objid, mesh);
+        if (!collider || !is_cached || source.lock() != mesh) {
+            collider = std::make_shared<BlenderCollider>();
+            collider->vert = mesh->verts().values;
+
+            int npolys = mesh->poly.size();
+            std::vector<int> tri_offset(npolys + 1);
+            tri_offset[0] = 0;
+            for (int i = 0; i < npolys; i++) {
+                tri_offset[i + 1] = tri_offset[i] + std::max(mesh->poly[i].len - 2, 0);
+            }
+            collider->tris.resize(tri_offset[npolys]);
+            #pragma omp parallel for
+            for (int i = 0; i < npolys; i++) {
+                auto [start, len] = mesh->poly[i];
+                if (len >= 3)
+                    ear_clip_polygon(collider->vert, &mesh->loop[start], len, &collider->tris[tri_offset[i]]);
+            }
+            collider->build_bvh();
+            source = is_cached ? mesh : nullptr;
+        }
+        collider->matrix = mesh->matrix;
+
+        set_output("collider", collider);
+    }
+};
+
+ZENDEFNODE(BlenderInputCollider, {
+    {},
+    {"collider"},
+    {},
+    {"blender"},
+});
+
+
+template <class T>
+static vec4f to_rgba(T const &c) {
+    if constexpr (is_vec_n<T> >= 4) {
+        return vec4f(c[0], c[1], c[2], c[3]);
+    } else if constexpr (is_vec_n<T> == 3) {
+        return vec4f(c[0], c[1], c[2], 1);
+    } else if constexpr (is_vec_n<T> == 2) {
+        return vec4f(c[0], c[1], 0, 1);
+    } else {
+        return vec4f(c, c, c, 1);
+    }
+}
+
+// whether the object `obj` read from input `id` can be borrowed without a copy:
+// besides this node, only the output slot of the node producing it holds it,
+// and no other node reads that slot, so nothing can modify it in place later
+template <class T>
+static bool is_sole_consumer(INode *node, std::string const &id, std::shared_ptr<T> const &obj) {
+    // `obj` itself, this node's input and the producer's output
+    if (obj.use_count() != 3)
+        return false;
+    auto bound = node->inputBounds.find(id);
+    if (bound == node->inputBounds.end())
+        return false;
+    for (auto const &[name, other]: node->graph->nodes) {
+        if (other.get() == node)
+            continue;
+        for (auto const &[key, source]: other->inputBounds) {
+            if (source == bound->second)
+                return false;
+        }
+    }
+    return true;
+}
+
+// vertices (and their attributes if `with_attrs`) of the primitive for the
+// mesh: borrowed when the primitive is out of reach of other nodes, otherwise
+// copied, as a node applied later could still modify the primitive in place
+static void export_vertices(INode *node, std::shared_ptr<PrimitiveObject> const &prim,
+        BlenderMesh *mesh, bool with_attrs) {
+    if (is_sole_consumer(node, "prim", prim)) {
+        mesh->shared_vert = std::shared_ptr<AttrVector<vec3f>>(prim, &prim->verts);
+        mesh->shared_vert_attrs = with_attrs;
+        return;
+    }
+    mesh->vert.values = prim->verts.values;  // the recycled buffer keeps its capacity
+    if (with_attrs) {
+        mesh->vert.attrs = prim->verts.attrs;
+    }
+}
+
 struct BlenderOutputPrimitive : INode {
     virtual void complete() override {
         if (get_param<bool>("active")) {
@@ -168,26 +637,17 @@ struct BlenderOutputPrimitive : INode {
         auto objid = get_input2<std::string>("objid");
 
         auto prim = get_input<PrimitiveObject>("prim");
-        auto mesh = std::make_shared<BlenderMesh>();
+        auto mesh = recycle_mesh(ud.outputs[objid]);
         // todo: support exporting transform matrix (for empty axis) too?
 
-        mesh->vert.resize(prim->size());
-        auto &pos = prim->attr<vec3f>("pos");
-        for (int i = 0; i < prim->size(); i++) {
-            mesh->vert[i] = pos[i];
-        }
-        if (get_param<bool>("has_vert_attr")) {
-            prim->verts.foreach_attr([&] (auto const &key, auto const &attr) {
-                mesh->vert.attrs[key] = attr;  // deep copy
-            });
-        }
+        export_vertices(this, prim, mesh.get(), get_param<bool>("has_vert_attr"));
 
         mesh->is_smooth = get_param<bool>("is_smooth");
         mesh->use_auto_smooth = get_param<bool>("use_auto_smooth");
 
         if (get_param<bool>("has_faces")) {
-            mesh->poly.resize(prim->tris.size() + prim->quads.size());
-            mesh->loop.resize(3 * prim->tris.size() + 4 * prim->quads.size());
+            mesh->poly.resize(prim->tris.size() + prim->quads.size() + prim->polys.size());
+            mesh->loop.resize(3 * prim->tris.size() + 4 * prim->quads.size() + prim->loops.size());
             #pragma omp parallel for
             for (int i = 0; i < prim->tris.size(); i++) {
                 auto e = prim->tris[i];
@@ -221,7 +681,29 @@ struct BlenderOutputPrimitive : INode {
                 prim->quads.foreach_attr([&] (auto const &key, auto const &attr) {
                     using T = std::decay_t<decltype(attr[0])>;
                     auto &arr = mesh->poly.add_attr<T>(key);
-                    for (int i = 0; i < prim->tris.size(); i++) {
+                    for (int i = 0; i < prim->quads.size(); i++) {
+                        arr[base_poly + i] = attr[i];
+                    }
+                });
+            }
+
+            // polygons kept untriangulated (see BlenderInputPrimitive::keep_polys)
+            base_loop += prim->quads.size() * 4;
+            base_poly += prim->quads.size();
+            #pragma omp parallel for
+            for (int i = 0; i < prim->loops.size(); i++) {
+                mesh->loop[base_loop + i] = prim->loops[i];
+            }
+            #pragma omp parallel for
+            for (int i = 0; i < prim->polys.size(); i++) {
+                auto [start, len] = prim->polys[i];
+                mesh->poly[base_poly + i] = {base_loop + start, len};
+            }
+            if (get_param<bool>("has_face_attr")) {
+                prim->polys.foreach_attr([&] (auto const &key, auto const &attr) {
+                    using T = std::decay_t<decltype(attr[0])>;
+                    auto &arr = mesh->poly.add_attr<T>(key);
+                    for (int i = 0; i < prim->polys.size(); i++) {
                         arr[base_poly + i] = attr[i];
                     }
                 });
@@ -229,16 +711,78 @@ struct BlenderOutputPrimitive : INode {
         }
 
         if (get_param<bool>("has_vert_color")) {
+            mesh->color_domain = get_param<std::string>("color_domain");
+            mesh->color_bytes = get_param<std::string>("color_type") == "BYTE_COLOR";
+            bool corner = mesh->color_domain == "CORNER";
+            int ncolors = corner ? mesh->loop.size() : prim->size();
+            // only the listed attributes become color layers, and they go out
+            // as colors only (blender attribute names are unique per mesh)
+            std::set<std::string> color_attrs;
+            std::istringstream names(get_param<std::string>("color_attrs"));
+            for (std::string name; names >> name;) {
+                color_attrs.insert(name);
+            }
             prim->verts.foreach_attr([&] (auto const &key, auto const &attr) {
-                using T = std::decay_t<decltype(attr[0])>;
-                auto &arr = mesh->loop.add_attr<T>(key);
+                if (!color_attrs.count(key))
+                    return;
+                auto &color = mesh->colors[key];
+                color.resize(ncolors);
                 #pragma omp parallel for
-                for (int i = 0; i < mesh->loop.size(); i++) {
-                    arr[i] = attr[mesh->loop[i]];
+                for (int i = 0; i < ncolors; i++) {
+                    color[i] = to_rgba(attr[corner ? mesh->loop[i] : i]);
                 }
             });
         }
 
+        int base_loop = prim->tris.size() * 3 + prim->quads.size() * 4;
+
+        if (get_param<bool>("has_normals") && prim->has_attr("nrm")) {
+            auto &nrm = prim->attr<vec3f>("nrm");
+            mesh->loop_nrm.resize(mesh->loop.size());
+            #pragma omp parallel for
+            for (int i = 0; i < mesh->loop.size(); i++) {
+                mesh->loop_nrm[i] = nrm[mesh->loop[i]];
+            }
+            if (prim->loops.has_attr("nrm")) {  // corner normals of kept polygons
+                auto &loop_nrm = prim->loops.attr<vec3f>("nrm");
+                #pragma omp parallel for
+                for (int i = 0; i < prim->loops.size(); i++) {
+                    mesh->loop_nrm[base_loop + i] = loop_nrm[i];
+                }
+            }
+        }
+
+        if (get_param<bool>("has_uvs") && (prim->has_attr("uv")
+                    || prim->tris.has_attr("uv0") || prim->loops.has_attr("uv"))) {
+            mesh->loop_uv.resize(mesh->loop.size());
+            if (prim->has_attr("uv")) {
+                auto &uv = prim->attr<vec3f>("uv");
+                #pragma omp parallel for
+                for (int i = 0; i < mesh->loop.size(); i++) {
+                    auto c = uv[mesh->loop[i]];
+                    mesh->loop_uv[i] = vec2f(c[0], c[1]);
+                }
+            }
+            if (prim->tris.has_attr("uv0")) {  // corner uvs of triangles
+                auto &uv0 = prim->tris.attr<vec3f>("uv0");
+                auto &uv1 = prim->tris.attr<vec3f>("uv1");
+                auto &uv2 = prim->tris.attr<vec3f>("uv2");
+                #pragma omp parallel for
+                for (int i = 0; i < prim->tris.size(); i++) {
+                    mesh->loop_uv[i*3 + 0] = vec2f(uv0[i][0], uv0[i][1]);
+                    mesh->loop_uv[i*3 + 1] = vec2f(uv1[i][0], uv1[i][1]);
+                    mesh->loop_uv[i*3 + 2] = vec2f(uv2[i][0], uv2[i][1]);
+                }
+            }
+            if (prim->loops.has_attr("uv")) {  // corner uvs of kept polygons
+                auto &uv = prim->loops.attr<vec3f>("uv");
+                #pragma omp parallel for
+                for (int i = 0; i < prim->loops.size(); i++) {
+                    mesh->loop_uv[base_loop + i] = vec2f(uv[i][0], uv[i][1]);
+                }
+            }
+        }
+
         if (get_param<bool>("has_edges")) {
             mesh->edge.resize(prim->lines.size());
             #pragma omp parallel for
@@ -248,6 +792,10 @@ struct BlenderOutputPrimitive : INode {
             }
         }
 
+        if (mesh->poly.size()) {
+            derive_edges(mesh.get(), prim->size());
+        }
+
         ud.outputs[objid] = std::move(mesh);
     }
 };
@@ -259,10 +807,290 @@ ZENDEFNODE(BlenderOutputPrimitive, {
     {"bool", "is_smooth", "0"},
     {"bool", "use_auto_smooth", "0"},
     {"bool", "has_vert_color", "0"},
+    {"enum CORNER POINT", "color_domain", "CORNER"},
+    {"enum FLOAT_COLOR BYTE_COLOR", "color_type", "FLOAT_COLOR"},
+    {"string", "color_attrs", "clr"},
     {"bool", "has_vert_attr", "0"},
     {"bool", "has_face_attr", "0"},
     {"bool", "has_edges", "0"},
     {"bool", "has_faces", "1"},
+    {"bool", "has_normals", "0"},
+    {"bool", "has_uvs", "0"},
+    {"bool", "active", "1"},
+    },
+    {"blender"},
+});
+
+
+template <class T>
+struct is_vec3 : std::false_type {};
+
+template <class T>
+struct is_vec3<vec<3, T>> : std::true_type {};
+
+// copy the vertex attribute `name` into dst, converting from whatever type it
+// has: numbers are cast (and broadcast to all components if `broadcast`),
+// 3-vectors are cast per component, anything else is an error
+template <class Dst>
+static void copy_attr_as(std::vector<Dst> &dst, PrimitiveObject *prim, std::string const &name, bool broadcast) {
+    std::visit([&] (auto const &attr) {
+        using T = std::decay_t<decltype(attr[0])>;
+        if constexpr (std::is_arithmetic_v<T> && std::is_same_v<Dst, float>) {
+            for (int i = 0; i < dst.size(); i++) {
+                dst[i] = float(attr[i]);
+            }
+            return;
+        } else if constexpr (std::is_arithmetic_v<T> && std::is_same_v<Dst, vec3f>) {
+            if (broadcast) {
+                for (int i = 0; i < dst.size(); i++) {
+                    dst[i] = vec3f(1, 1, 1) * float(attr[i]);
+                }
+                return;
+            }
+        } else if constexpr (is_vec3<T>::value && std::is_same_v<Dst, vec3f>) {
+            for (int i = 0; i < dst.size(); i++) {
+                dst[i] = vec3f(float(attr[i][0]), float(attr[i][1]), float(attr[i][2]));
+            }
+            return;
+        }
+        throw std::runtime_error("vertex attribute `" + name + "` must be "
+                + (std::is_same_v<Dst, float> ? "a number" : broadcast ? "a number or a 3-vector" : "a 3-vector"));
+    }, prim->verts.attrs.at(name));
+}
+
+struct BlenderOutputInstances : INode {
+    virtual void complete() override {
+        if (get_param<bool>("active")) {
+            graph->finalOutputNodes.insert(myname);
+        }
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+
+        auto prim = get_input<PrimitiveObject>("prim");
+        auto mesh = recycle_mesh(ud.outputs[objid]);
+        mesh->instance_collection = get_input2<std::string>("instance");
+
+        // only points go out, the instanced shape stays in blender
+        export_vertices(this, prim, mesh.get(), false);
+        int npoints = prim->size();
+
+        auto &rotation = mesh->vert.add_attr<vec3f>("rotation");
+        auto &scale = mesh->vert.add_attr<vec3f>("scale");
+        auto &index = mesh->vert.add_attr<float>("instance_index");
+        rotation.assign(npoints, vec3f(0, 0, 0));
+        scale.assign(npoints, vec3f(1, 1, 1));
+        index.assign(npoints, 0.f);
+
+        auto rotation_attr = get_param<std::string>("rotation_attr");
+        if (prim->verts.has_attr(rotation_attr)) {
+            copy_attr_as(rotation, prim.get(), rotation_attr, false);
+        }
+        auto scale_attr = get_param<std::string>("scale_attr");
+        if (prim->verts.has_attr(scale_attr)) {
+            copy_attr_as(scale, prim.get(), scale_attr, true);
+        }
+        auto index_attr = get_param<std::string>("index_attr");
+        if (prim->verts.has_attr(index_attr)) {
+            copy_attr_as(index, prim.get(), index_attr, false);  // int indices are common
+        }
+
+        ud.outputs[objid] = std::move(mesh);
+    }
+};
+
+ZENDEFNODE(BlenderOutputInstances, {
+    {"prim"},
+    {},
+    {
+    {"string", "rotation_attr", "rot"},
+    {"string", "scale_attr", "scale"},
+    {"string", "index_attr", "inst"},
+    {"bool", "active", "1"},
+    },
+    {"blender"},
+});
+
+
+static bool same_file_content(std::string const &path1, std::string const &path2) {
+    std::error_code ec1, ec2;
+    auto size1 = std::filesystem::file_size(path1, ec1);
+    auto size2 = std::filesystem::file_size(path2, ec2);
+    if (ec1 || ec2 || size1 != size2)
+        return false;
+    std::ifstream file1(path1, std::ios::binary), file2(path2, std::ios::binary);
+    return std::equal(std::istreambuf_iterator<char>(file1), std::istreambuf_iterator<char>(),
+            std::istreambuf_iterator<char>(file2));
+}
+
+struct BlenderOutputVolume : INode {
+    virtual void complete() override {
+        if (get_param<bool>("active")) {
+            graph->finalOutputNodes.insert(myname);
+        }
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+        auto grid = get_input("grid");
+
+        char frame[16];
+        std::snprintf(frame, sizeof(frame), "%06d", ud.frame);
+        auto volume = std::make_shared<BlenderVolume>();
+        volume->path = ud.cache_dir + "/" + objid + "_" + frame + ".vdb";
+
+        auto path = std::make_shared<StringObject>();
+        path->set(volume->path + ".tmp");
+        // written by the openvdb extension, so we don't need to link openvdb
+        graph->callTempNode("ExportVDBGrid", {{"data", grid}, {"path", path}});
+        // upstream nodes make a new grid object on every apply, so compare the
+        // written files instead: an unchanged one keeps its mtime, and Blender
+        // doesn't reload it (see scenario.volumeToBlender)
+        std::error_code ec;
+        if (same_file_content(path->get(), volume->path)) {
+            std::filesystem::remove(path->get(), ec);
+        } else {
+            std::filesystem::rename(path->get(), volume->path, ec);
+            if (ec)
+                throw std::runtime_error("cannot write volume cache `" + volume->path + "`: " + ec.message());
+        }
+
+        ud.outputs[objid] = std::move(volume);
+    }
+};
+
+ZENDEFNODE(BlenderOutputVolume, {
+    {"grid"},
+    {},
+    {
+    {"bool", "active", "1"},
+    },
+    {"blender"},
+});
+
+
+// split line connectivity into polylines, breaking at ends and branch points;
+// closed loops are flagged in `cyclic` and don't repeat their first vertex
+static std::vector<std::vector<int>> trace_polylines(int nverts, AttrVector<vec2i> const &lines,
+        std::vector<char> &cyclic) {
+    std::vector<int> offset(nverts + 1, 0);
+    for (int i = 0; i < lines.size(); i++) {
+        offset[lines[i][0] + 1]++;
+        offset[lines[i][1] + 1]++;
+    }
+    std::partial_sum(offset.begin(), offset.end(), offset.begin());
+    std::vector<int> adj(offset[nverts]), cursor(offset.begin(), offset.end() - 1);
+    for (int i = 0; i < lines.size(); i++) {
+        adj[cursor[lines[i][0]]++] = i;
+        adj[cursor[lines[i][1]]++] = i;
+    }
+
+    std::vector<char> visited(lines.size(), 0);
+    std::vector<std::vector<int>> polylines;
+    auto walk = [&] (int v, int e) {
+        std::vector<int> polyline{v};
+        while (!visited[e]) {
+            visited[e] = 1;
+            v = lines[e][0] == v ? lines[e][1] : lines[e][0];
+            polyline.push_back(v);
+            if (offset[v + 1] - offset[v] != 2)
+                break;
+            e = adj[offset[v]] == e ? adj[offset[v] + 1] : adj[offset[v]];
+        }
+        bool closed = polyline.size() > 3 && polyline.back() == polyline.front();
+        if (closed)
+            polyline.pop_back();
+        cyclic.push_back(closed);
+        polylines.push_back(std::move(polyline));
+    };
+    for (int v = 0; v < nverts; v++) {
+        if (offset[v + 1] - offset[v] == 2) continue;
+        for (int k = offset[v]; k < offset[v + 1]; k++) {
+            if (!visited[adj[k]])
+                walk(v, adj[k]);
+        }
+    }
+    for (int v = 0; v < nverts; v++) {  // closed loops left over
+        for (int k = offset[v]; k < offset[v + 1]; k++) {
+            if (!visited[adj[k]])
+                walk(v, adj[k]);
+        }
+    }
+    return polylines;
+}
+
+
+struct BlenderOutputCurves : INode {
+    virtual void complete() override {
+        if (get_param<bool>("active")) {
+            graph->finalOutputNodes.insert(myname);
+        }
+    }
+
+    virtual void apply() override {
+        auto &ud = graph->getUserData().get<BlenderData>("blender_data");
+        auto objid = get_input2<std::string>("objid");
+
+        auto prim = get_input<PrimitiveObject>("prim");
+        auto curves = std::make_shared<BlenderCurves>();
+
+        auto polylines = trace_polylines(prim->size(), prim->lines, curves->cyclic);
+        curves->curve_offsets.resize(polylines.size() + 1);
+        for (int i = 0; i < polylines.size(); i++) {
+            curves->curve_offsets[i + 1] = curves->curve_offsets[i] + polylines[i].size();
+        }
+        std::vector<int> point_vert(curves->curve_offsets.back());
+        #pragma omp parallel for
+        for (int i = 0; i < polylines.size(); i++) {
+            std::copy(polylines[i].begin(), polylines[i].end(),
+                    point_vert.begin() + curves->curve_offsets[i]);
+        }
+
+        auto &pos = prim->attr<vec3f>("pos");
+        curves->point.resize(point_vert.size());
+        #pragma omp parallel for
+        for (int i = 0; i < point_vert.size(); i++) {
+            curves->point[i] = pos[point_vert[i]];
+        }
+
+        auto &radius = curves->point.add_attr<float>("radius");
+        auto radius_attr = get_param<std::string>("radius_attr");
+        if (prim->verts.has_attr(radius_attr)) {
+            auto &rad = prim->verts.attr<float>(radius_attr);
+            #pragma omp parallel for
+            for (int i = 0; i < point_vert.size(); i++) {
+                radius[i] = rad[point_vert[i]];
+            }
+        } else {
+            std::fill(radius.begin(), radius.end(), get_param<float>("radius"));
+        }
+
+        if (get_param<bool>("has_point_attr")) {
+            prim->verts.foreach_attr([&] (auto const &key, auto const &attr) {
+                if (key == radius_attr) return;
+                using T = std::decay_t<decltype(attr[0])>;
+                auto &arr = curves->point.add_attr<T>(key);
+                #pragma omp parallel for
+                for (int i = 0; i < point_vert.size(); i++) {
+                    arr[i] = attr[point_vert[i]];
+                }
+            });
+        }
+
+        ud.outputs[objid] = std::move(curves);
+    }
+};
+
+ZENDEFNODE(BlenderOutputCurves, {
+    {"prim"},
+    {},
+    {
+    {"string", "radius_attr", "rad"},
+    {"float", "radius", "0.01"},
+    {"bool", "has_point_attr", "0"},
     {"bool", "active", "1"},
     },
     {"blender"},
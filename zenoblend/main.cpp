@@ -9,13 +9,207 @@ namespace py = pybind11;
 #include <blender/blenlib/BLI_float3.hh>
 
 #include <zeno/zeno.h>
+#include <zeno/utils/safe_at.h>
 #include "BlenderMesh.h"
+#include <algorithm>
+#include <array>
+#include <cmath>
+#include <stdexcept>
+#include <type_traits>
+#include <variant>
 
 PYBIND11_MAKE_OPAQUE(std::vector<float>);
 PYBIND11_MAKE_OPAQUE(std::vector<std::vector<float>>);
 
 static std::map<int, std::unique_ptr<zeno::Scene>> scenes;
 
+static void writeVertices(zeno::BlenderMesh const *mesh, MVert *vert, size_t vertCount) {
+    auto const &meshVert = mesh->verts();
+    #pragma omp parallel for
+    for (int i = 0; i < vertCount; i++) {
+        vert[i].co[0] = meshVert[i][0];
+        vert[i].co[1] = meshVert[i][1];
+        vert[i].co[2] = meshVert[i][2];
+    }
+}
+
+// blender attribute type holding attributes of element type T, nullptr if none
+template <class T>
+static constexpr const char *blenderAttrType() {
+    if constexpr (std::is_same_v<T, float>)
+        return "FLOAT";
+    else if constexpr (std::is_same_v<T, int>)
+        return "INT";
+    else if constexpr (std::is_same_v<T, zeno::vec2f>)
+        return "FLOAT2";
+    else if constexpr (std::is_same_v<T, zeno::vec3f> || std::is_same_v<T, zeno::vec3i>)
+        return "FLOAT_VECTOR";
+    else if constexpr (std::is_same_v<T, zeno::vec4f>)
+        return "FLOAT_COLOR";
+    else
+        return nullptr;
+}
+
+template <class Attr>
+static const char *attrTypeName(std::string const &key, Attr const &attr) {
+    return std::visit([&] (auto const &arr) -> const char * {
+        using T = std::decay_t<decltype(arr[0])>;
+        if constexpr (blenderAttrType<T>() == nullptr) {
+            throw std::invalid_argument("attribute `" + key + "` is of a type blender can't hold");
+        } else {
+            return blenderAttrType<T>();
+        }
+    }, attr);
+}
+
+// write into a blender attribute layer of the type attrTypeName gives
+template <class Attr>
+static void writeAttr(Attr const &attr, uintptr_t attrPtr, size_t count) {
+    std::visit([&] (auto const &arr) {
+        using T = std::decay_t<decltype(arr[0])>;
+        if constexpr (blenderAttrType<T>() == nullptr) {
+            throw std::invalid_argument("attribute of a type blender can't hold");
+        } else if constexpr (std::is_same_v<T, int>) {
+            auto outAttr = reinterpret_cast<MIntProperty *>(attrPtr);
+            #pragma omp parallel for
+            for (int i = 0; i < count; i++) {
+                outAttr[i].i = arr[i];
+            }
+        } else if constexpr (std::is_same_v<T, float>) {
+            auto outAttr = reinterpret_cast<MFloatProperty *>(attrPtr);
+            #pragma omp parallel for
+            for (int i = 0; i < count; i++) {
+                outAttr[i].f = arr[i];
+            }
+        } else {  // vectors, as floats
+            constexpr int n = sizeof(T) / sizeof(arr[0][0]);
+            auto outAttr = reinterpret_cast<float *>(attrPtr);
+            #pragma omp parallel for
+            for (int i = 0; i < count; i++) {
+                for (int c = 0; c < n; c++) {
+                    outAttr[i * n + c] = arr[i][c];
+                }
+            }
+        }
+    }, attr);
+}
+
+static void writePolygons(zeno::BlenderMesh const *mesh, MPoly *poly, size_t polyCount) {
+    #pragma omp parallel for
+    for (int i = 0; i < polyCount; i++) {
+        poly[i].loopstart = mesh->poly[i].start;
+        poly[i].totloop = mesh->poly[i].len;
+        if (mesh->is_smooth)
+            poly[i].flag |= ME_SMOOTH;
+    }
+}
+
+static void writeLoops(zeno::BlenderMesh const *mesh, MLoop *loop, size_t loopCount) {
+    bool hasLoopEdge = mesh->loop_edge.size() == loopCount;
+    #pragma omp parallel for
+    for (int i = 0; i < loopCount; i++) {
+        loop[i].v = mesh->loop[i];
+        loop[i].e = hasLoopEdge ? mesh->loop_edge[i] : 0;
+    }
+}
+
+static void writeEdges(zeno::BlenderMesh const *mesh, MEdge *edge, size_t edgeCount) {
+    #pragma omp parallel for
+    for (int i = 0; i < edgeCount; i++) {
+        edge[i].v1 = mesh->edge[i].src;
+        edge[i].v2 = mesh->edge[i].dst;
+        edge[i].flag |= ME_EDGEDRAW | ME_EDGERENDER;
+    }
+}
+
+// linear to 8-bit with a 2.2 gamma: the byte value is the number of level
+// thresholds not above x, which spares a pow() per channel
+static std::array<float, 255> const &byteColorThresholds() {
+    static const auto thresholds = [] {
+        std::array<float, 255> t;
+        for (int k = 0; k < 255; k++) {
+            t[k] = std::pow((k + 0.5f) / 255.f, 2.2f);
+        }
+        return t;
+    }();
+    return thresholds;
+}
+
+static void writeColors(std::vector<zeno::vec4f> const &colors, uintptr_t colorPtr, size_t count, bool bytes) {
+    if (bytes) {
+        auto const &thresholds = byteColorThresholds();
+        auto toByte = [&] (float x) -> unsigned char {
+            return std::upper_bound(thresholds.begin(), thresholds.end(), x) - thresholds.begin();
+        };
+        auto color = reinterpret_cast<MLoopCol *>(colorPtr);
+        #pragma omp parallel for
+        for (int i = 0; i < count; i++) {
+            color[i].r = toByte(colors[i][0]);
+            color[i].g = toByte(colors[i][1]);
+            color[i].b = toByte(colors[i][2]);
+            color[i].a = static_cast<unsigned char>(zeno::clamp(colors[i][3] * 255.f + 0.5f, 0.f, 255.f));
+        }
+    } else {
+        auto color = reinterpret_cast<MPropCol *>(colorPtr);
+        #pragma omp parallel for
+        for (int i = 0; i < count; i++) {
+            for (int c = 0; c < 4; c++) {
+                color[i].color[c] = colors[i][c];
+            }
+        }
+    }
+}
+
+static void writeLoopNormals(zeno::BlenderMesh const *mesh, blender::float3 *loopNrm, size_t loopCount) {
+    #pragma omp parallel for
+    for (int i = 0; i < loopCount; i++) {
+        loopNrm[i].x = mesh->loop_nrm[i][0];
+        loopNrm[i].y = mesh->loop_nrm[i][1];
+        loopNrm[i].z = mesh->loop_nrm[i][2];
+    }
+}
+
+static void writeLoopUVs(zeno::BlenderMesh const *mesh, MLoopUV *loopUV, size_t loopCount) {
+    #pragma omp parallel for
+    for (int i = 0; i < loopCount; i++) {
+        loopUV[i].uv[0] = mesh->loop_uv[i][0];
+        loopUV[i].uv[1] = mesh->loop_uv[i][1];
+    }
+}
+
+// the default of a socket as the python value its blender socket takes,
+// None when there is none or it doesn't parse
+static py::object parseDefault(std::string const &type, std::string const &defl) {
+    if (type == "string" || type == "readpath" || type == "writepath" || type == "multiline_string")
+        return py::str(defl);
+    auto value = defl.substr(0, defl.find(' '));  // may be followed by min and max
+    if (value.empty())
+        return py::none();
+    try {
+        if (type == "int")
+            return py::int_(std::stoi(value));
+        if (type == "bool")
+            return py::bool_(std::stoi(value) != 0);
+        if (type == "float" || type == "NumericObject")
+            return py::float_(std::stof(value));
+        if (type == "vec3f" || type == "color3f") {
+            auto i = value.find(','), j = value.find(',', i + 1);
+            if (i == std::string::npos || j == std::string::npos)
+                return py::none();
+            return py::make_tuple(std::stof(value.substr(0, i)),
+                    std::stof(value.substr(i + 1, j - i - 1)), std::stof(value.substr(j + 1)));
+        }
+    } catch (std::logic_error const &) {  // std::invalid_argument, std::out_of_range
+        return py::none();
+    }
+    return py::str(value);
+}
+
+// generation each node type was first returned by getDescriptors in, so a
+// caller can fetch only the types of the libraries loaded since
+static int descriptorGeneration = 0;
+static std::map<std::string, int> descriptorGenerations;
+
 PYBIND11_MODULE(pylib_zenoblend, m) {
 
     m.def("dumpDescriptors", []
@@ -25,6 +219,51 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
         return zeno::dumpDescriptors();
     });
 
+    m.def("getDescriptors", []
+            ( int since
+            ) -> std::pair<int, py::list>
+    {
+        auto const &nodeClasses = zeno::getSession().nodeClasses;
+        bool hasNew = false;
+        for (auto const &[name, cls]: nodeClasses) {
+            if (descriptorGenerations.count(name))
+                continue;
+            if (!hasNew) {
+                descriptorGeneration++;
+                hasNew = true;
+            }
+            descriptorGenerations[name] = descriptorGeneration;
+        }
+
+        // same layout as get_descriptors used to parse out of dumpDescriptors:
+        // (title, [(type, name, default)], [(type, name, default)], category),
+        // params appended to the inputs with a trailing colon in their names
+        py::list result;
+        for (auto const &[name, cls]: nodeClasses) {
+            if (descriptorGenerations.at(name) <= since)
+                continue;
+            auto const &desc = *cls->desc;
+            py::list inputs, outputs;
+            for (auto const &socket: desc.inputs) {
+                if (socket.name != "SRC")
+                    inputs.append(py::make_tuple(socket.type, socket.name, parseDefault(socket.type, socket.defl)));
+            }
+            for (auto const &param: desc.params) {
+                inputs.append(py::make_tuple(param.type, param.name + ":", parseDefault(param.type, param.defl)));
+            }
+            for (auto const &socket: desc.outputs) {
+                if (socket.name != "DST")
+                    outputs.append(py::make_tuple(socket.type, socket.name, parseDefault(socket.type, socket.defl)));
+            }
+            std::string category;
+            for (auto const &cate: desc.categories) {
+                category += (category.empty() ? "" : "%") + cate;
+            }
+            result.append(py::make_tuple(name, inputs, outputs, category));
+        }
+        return {descriptorGeneration, result};
+    });
+
     m.def("createScene", []
             (
             ) -> int
@@ -39,7 +278,10 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
             ( int sceneId
             ) -> void
     {
-        scenes.erase(sceneId);
+        if (auto it = scenes.find(sceneId); it != scenes.end()) {
+            zeno::shared_objects().erase(it->second.get());
+            scenes.erase(it);
+        }
     });
 
     m.def("sceneSwitchToGraph", []
@@ -66,6 +308,7 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
             ) -> void
     {
         auto const &scene = scenes.at(sceneId);
+        zeno::shared_objects().erase(scene.get());
         scene->loadScene(jsonStr);
     });
 
@@ -78,6 +321,46 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
         return ud.input_names;
     });
 
+    m.def("graphGetInputComponents", []
+            ( uintptr_t graphPtr
+            ) -> std::map<std::string, std::set<std::string>>
+    {
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+        return ud.input_components;
+    });
+
+    m.def("graphGetImageNames", []
+            ( uintptr_t graphPtr
+            ) -> std::set<std::string>
+    {
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+        return ud.image_names;
+    });
+
+    m.def("graphAllocImage", []
+            ( uintptr_t graphPtr
+            , std::string const &imageName
+            , int width
+            , int height
+            , int channels
+            ) -> uintptr_t
+    {
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        // the caller fills the returned buffer right away (Image.pixels.foreach_get)
+        auto &image = ud.images[imageName];
+        if (!image || image.use_count() > 1)
+            image = std::make_shared<zeno::BlenderImage>();
+        image->width = width;
+        image->height = height;
+        image->channels = channels;
+        image->pixels.resize((size_t)width * height * channels);
+        return reinterpret_cast<uintptr_t>(image->pixels.data());
+    });
+
     m.def("graphGetOutputNames", []
             ( uintptr_t graphPtr
             ) -> std::set<std::string>
@@ -115,6 +398,32 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
         };
     });
 
+    m.def("graphSetInputCamera", []
+            ( uintptr_t graphPtr
+            , std::string objName
+            , std::array<std::array<float, 4>, 4> matrix
+            , std::array<std::array<float, 4>, 4> viewProjection
+            , std::array<int, 2> resolution
+            , std::array<float, 2> clipRange
+            , bool isOrtho
+            ) -> void
+    {
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        ud.inputs[objName] = [=] () -> std::shared_ptr<zeno::BlenderAxis> {
+            auto camera = std::make_shared<zeno::BlenderCamera>();
+            camera->matrix = matrix;
+            camera->view_projection = viewProjection;
+            camera->width = resolution[0];
+            camera->height = resolution[1];
+            camera->clip_start = clipRange[0];
+            camera->clip_end = clipRange[1];
+            camera->is_ortho = isOrtho;
+            return camera;
+        };
+    });
+
     m.def("graphSetInputMesh", []
             ( uintptr_t graphPtr
             , std::string objName
@@ -127,13 +436,21 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
             , size_t polyCount
             , uintptr_t edgePtr
             , size_t edgeCount
+            , bool cached
             ) -> void
     {
         auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
         auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
 
-        ud.inputs[objName] = [=] () -> std::shared_ptr<zeno::BlenderAxis> {
-            auto mesh = std::make_shared<zeno::BlenderMesh>();
+        ud.input_cache.erase(objName);
+        ud.inputs[objName] = [=, &ud] () -> std::shared_ptr<zeno::BlenderAxis> {
+            if (cached) {
+                auto it = ud.input_cache.find(objName);
+                if (it != ud.input_cache.end())
+                    return it->second;
+            }
+            auto mesh = cached ? std::make_shared<zeno::BlenderMesh>()
+                : zeno::recycle_mesh(ud.input_pool[objName]);
             mesh->matrix = matrix;
             mesh->vert.resize(vertCount);
             auto vert = reinterpret_cast<MVert const *>(vertPtr);
@@ -155,252 +472,318 @@ PYBIND11_MODULE(pylib_zenoblend, m) {
             for (int i = 0; i < edgeCount; i++) {
                 mesh->edge[i] = {edge[i].v1, edge[i].v2};
             }
+            if (ud.preview_resolution > 0)
+                zeno::decimate_mesh(mesh.get(), ud.preview_resolution);
+            if (cached)
+                ud.input_cache[objName] = mesh;
             return mesh;
         };
     });
 
-    // todo: support input/output volume too
-    m.def("graphGetOutputMesh", []
+    m.def("graphSetInputVertAttr", []
             ( uintptr_t graphPtr
-            , std::string const &objName
-            ) -> uintptr_t
+            , std::string objName
+            , std::string attrName
+            , uintptr_t attrPtr
+            , size_t count
+            , int components
+            ) -> void
     {
         auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
         auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+        if (components != 1 && components != 3)
+            throw std::invalid_argument("vertex attribute `" + attrName + "` must have 1 or 3 components");
+
+        // copied right away, the caller's array needn't outlive this call
+        auto data = reinterpret_cast<float const *>(attrPtr);
+        zeno::AttrVector<zeno::vec3f>::AttrVectorVariant values;
+        if (components == 3) {
+            std::vector<zeno::vec3f> arr(count);
+            for (size_t i = 0; i < count; i++) {
+                arr[i] = {data[i * 3 + 0], data[i * 3 + 1], data[i * 3 + 2]};
+            }
+            values = std::move(arr);
+        } else {
+            values = std::vector<float>(data, data + count);
+        }
 
-        auto const &mesh = ud.outputs.at(objName);
-        auto meshPtr = reinterpret_cast<uintptr_t>(mesh.get());
-        return meshPtr;
+        // attached to the mesh the input already set builds, when applied
+        auto input = zeno::safe_at(ud.inputs, objName, "blender input");
+        ud.inputs[objName] = [=] () -> std::shared_ptr<zeno::BlenderAxis> {
+            auto object = input();
+            auto mesh = std::dynamic_pointer_cast<zeno::BlenderMesh>(object);
+            // decimated preview meshes have fewer vertices, nothing to attach to
+            if (mesh && mesh->vert.size() == count)
+                mesh->vert.attrs[attrName] = values;
+            return object;
+        };
     });
 
-    m.def("meshGetMatrix", []
-            ( uintptr_t meshPtr
-            ) -> std::array<std::array<float, 4>, 4>
+    m.def("graphSetInputMatrix", []
+            ( uintptr_t graphPtr
+            , std::string objName
+            , std::array<std::array<float, 4>, 4> matrix
+            ) -> bool
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        return mesh->matrix;
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        // reuse the cached local-space mesh, only the transform changed
+        auto it = ud.input_cache.find(objName);
+        if (it == ud.input_cache.end())
+            return false;
+        auto mesh = it->second;
+        mesh->matrix = matrix;
+        ud.inputs[objName] = [=] () -> std::shared_ptr<zeno::BlenderAxis> {
+            return mesh;
+        };
+        return true;
     });
 
-    m.def("meshGetVerticesCount", []
-            ( uintptr_t meshPtr
-            ) -> size_t
+    m.def("textSetBody", []
+            ( std::string const &key
+            , std::string body
+            ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        return mesh->vert.size();
+        zeno::text_bodies()[key] = std::move(body);
     });
 
-    m.def("meshGetVertices", []
-            ( uintptr_t meshPtr
-            , uintptr_t vertPtr
-            , size_t vertCount
+    m.def("textDropBody", []
+            ( std::string const &key
             ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        auto vert = reinterpret_cast<MVert *>(vertPtr);
-        for (int i = 0; i < vertCount; i++) {
-            vert[i].co[0] = mesh->vert[i][0];
-            vert[i].co[1] = mesh->vert[i][1];
-            vert[i].co[2] = mesh->vert[i][2];
-        }
+        zeno::text_bodies().erase(key);
     });
 
-    m.def("meshGetVertAttrNameType", []
-        ( uintptr_t meshPtr
-        ) -> std::map<std::string, size_t>
+    m.def("graphTrimBuffers", []
+            ( uintptr_t graphPtr
+            ) -> void
     {
-        std::map<std::string, size_t> attrNameType;
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        for (auto const& [key, value] : mesh->vert.attrs) {
-            attrNameType.emplace(key, value.index());
-        }
-        return attrNameType;
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        // give back the buffers kept for reuse, the outputs are already written to blender
+        ud.input_pool.clear();
+        ud.outputs.clear();
+        ud.colliders.clear();
+        ud.input_prims.clear();
     });
 
-    m.def("meshGetVertAttr", []
-        ( uintptr_t meshPtr
-        , std::string attrName
-        , uintptr_t vertAttrPtr
-        , size_t vertCount
-        ) -> void
+    m.def("graphSetFrameInfo", []
+            ( uintptr_t graphPtr
+            , int frame
+            , std::string cacheDir
+            ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        
-        for (int i = 0; i < vertCount; i++) {
-            auto attr = mesh->vert.attrs.at(attrName);
-            size_t attrIndex = attr.index();
-            if (attrIndex == 0) {
-                auto vertAttr = reinterpret_cast<blender::float3 *>(vertAttrPtr);
-                auto attrFloat3 = std::get<0>(attr)[i];
-                vertAttr[i].x = attrFloat3[0];
-                vertAttr[i].y = attrFloat3[1];
-                vertAttr[i].z = attrFloat3[2];
-            } else if (attrIndex == 1) {
-                auto vertAttr = reinterpret_cast<MFloatProperty *>(vertAttrPtr);
-                vertAttr[i].f = std::get<1>(attr)[i];
-            }
-        }
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+        ud.frame = frame;
+        ud.cache_dir = cacheDir;
     });
 
-    m.def("meshGetPolyAttrNameType", []
-        ( uintptr_t meshPtr
-        ) -> std::map<std::string, size_t>
+    m.def("graphSetPreview", []
+            ( uintptr_t graphPtr
+            , int resolution
+            ) -> void
     {
-        std::map<std::string, size_t> attrNameType;
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        for (auto const& [key, value] : mesh->poly.attrs) {
-            attrNameType.emplace(key, value.index());
-        }
-        return attrNameType;
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+        ud.preview_resolution = resolution;
     });
 
-    m.def("meshGetPolyAttr", []
-        ( uintptr_t meshPtr
-        , std::string attrName
-        , uintptr_t polyAttrPtr
-        , size_t polyCount
-        ) -> void
+    m.def("graphGetOutputType", []
+            ( uintptr_t graphPtr
+            , std::string const &objName
+            ) -> std::string
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        
-        for (int i = 0; i < polyCount; i++) {
-            auto attr = mesh->poly.attrs.at(attrName);
-            size_t attrIndex = attr.index();
-            if (attrIndex == 0) {
-                auto polyAttr = reinterpret_cast<blender::float3 *>(polyAttrPtr);
-                auto attrFloat3 = std::get<0>(attr)[i];
-                polyAttr[i].x = attrFloat3[0];
-                polyAttr[i].y = attrFloat3[1];
-                polyAttr[i].z = attrFloat3[2];
-            } else if (attrIndex == 1) {
-                auto polyAttr = reinterpret_cast<MFloatProperty *>(polyAttrPtr);
-                polyAttr[i].f = std::get<1>(attr)[i];
-            }
-        }
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        auto const &object = ud.outputs.at(objName);
+        if (dynamic_cast<zeno::BlenderVolume *>(object.get()))
+            return "volume";
+        if (dynamic_cast<zeno::BlenderCurves *>(object.get()))
+            return "curves";
+        return "mesh";
     });
 
-    m.def("meshGetPolygonsCount", []
-        ( uintptr_t meshPtr
-        ) -> size_t
+    // todo: support input volume too
+    m.def("graphGetOutputMesh", []
+            ( uintptr_t graphPtr
+            , std::string const &objName
+            ) -> uintptr_t
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        return mesh->poly.size();
+        auto graph = reinterpret_cast<zeno::Graph *>(graphPtr);
+        auto &ud = graph->getUserData().get<zeno::BlenderData>("blender_data");
+
+        auto const &mesh = ud.outputs.at(objName);
+        auto meshPtr = reinterpret_cast<uintptr_t>(mesh.get());
+        return meshPtr;
     });
 
-    m.def("meshGetPolygons", []
-            ( uintptr_t meshPtr
-            , uintptr_t polyPtr
-            , size_t polyCount
-            ) -> void
+    m.def("volumeGetPath", []
+            ( uintptr_t volumePtr
+            ) -> std::string
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        auto poly = reinterpret_cast<MPoly *>(polyPtr);
-        for (int i = 0; i < polyCount; i++) {
-            poly[i].loopstart = mesh->poly[i].start;
-            poly[i].totloop = mesh->poly[i].len;
-            if (mesh->is_smooth)
-                poly[i].flag |= ME_SMOOTH;
-        }
+        auto volume = reinterpret_cast<zeno::BlenderVolume *>(volumePtr);
+        return volume->path;
     });
 
-    m.def("meshGetLoopsCount", []
-        ( uintptr_t meshPtr
-        ) -> size_t
+    m.def("curvesGetCurvesCount", []
+            ( uintptr_t curvesPtr
+            ) -> size_t
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        return mesh->loop.size();
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        return curves->curve_offsets.size() - 1;
     });
 
-    m.def("meshGetLoops", []
-        ( uintptr_t meshPtr
-        , uintptr_t loopPtr
-        , size_t loopCount
-        ) -> void
+    m.def("curvesGetSizes", []
+            ( uintptr_t curvesPtr
+            , uintptr_t sizesPtr
+            , size_t curveCount
+            ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        auto loop = reinterpret_cast<MLoop *>(loopPtr);
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        auto sizes = reinterpret_cast<int *>(sizesPtr);
+        #pragma omp parallel for
+        for (int i = 0; i < curveCount; i++) {
+            sizes[i] = curves->curve_offsets[i + 1] - curves->curve_offsets[i];
+        }
+    });
 
-        for (int i = 0; i < loopCount; i++) {
-            loop[i].v = mesh->loop[i];
-            loop[i].e = 0;
+    m.def("curvesGetCyclic", []
+            ( uintptr_t curvesPtr
+            , uintptr_t cyclicPtr
+            , size_t curveCount
+            ) -> void
+    {
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        auto cyclic = reinterpret_cast<bool *>(cyclicPtr);
+        for (int i = 0; i < curveCount; i++) {
+            cyclic[i] = curves->cyclic[i];
         }
     });
 
-    m.def("meshGetEdgesCount", []
-        ( uintptr_t meshPtr
-        ) -> size_t
+    m.def("curvesGetPointsCount", []
+            ( uintptr_t curvesPtr
+            ) -> size_t
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        return mesh->edge.size();
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        return curves->point.size();
     });
 
-    m.def("meshGetEdges", []
-            ( uintptr_t meshPtr
-            , uintptr_t edgePtr
-            , size_t edgeCount
+    m.def("curvesGetPoints", []
+            ( uintptr_t curvesPtr
+            , uintptr_t pointPtr
+            , size_t pointCount
             ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        auto edge = reinterpret_cast<MEdge *>(edgePtr);
-        for (int i = 0; i < edgeCount; i++) {
-            edge[i].v1 = mesh->edge[i].src;
-            edge[i].v2 = mesh->edge[i].dst;
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        auto point = reinterpret_cast<blender::float3 *>(pointPtr);
+        #pragma omp parallel for
+        for (int i = 0; i < pointCount; i++) {
+            point[i].x = curves->point[i][0];
+            point[i].y = curves->point[i][1];
+            point[i].z = curves->point[i][2];
         }
     });
 
-
-    m.def("meshGetLoopAttrNameType", []
-        ( uintptr_t meshPtr
-        ) -> std::map<std::string, size_t>
+    m.def("curvesGetPointAttrNameType", []
+        ( uintptr_t curvesPtr
+        ) -> std::map<std::string, std::string>
     {
-        std::map<std::string, size_t> attrNameType;
-        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
-        for (auto const& [key, value] : mesh->loop.attrs) {
-            attrNameType.emplace(key, value.index());
+        std::map<std::string, std::string> attrNameType;
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        for (auto const& [key, value] : curves->point.attrs) {
+            attrNameType.emplace(key, attrTypeName(key, value));
         }
         return attrNameType;
     });
 
-    m.def("meshGetLoopColor", []
-        ( uintptr_t meshPtr
-        , std::string const &attrName
-        , uintptr_t loopColorPtr
-        , size_t loopCount
+    m.def("curvesGetPointAttr", []
+        ( uintptr_t curvesPtr
+        , std::string attrName
+        , uintptr_t pointAttrPtr
+        , size_t pointCount
         ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh*>(meshPtr);
+        auto curves = reinterpret_cast<zeno::BlenderCurves *>(curvesPtr);
+        writeAttr(curves->point.attrs.at(attrName), pointAttrPtr, pointCount);
+    });
 
-        auto const &attr = mesh->loop.attrs.at(attrName);
-        auto attrIndex = attr.index();
-        auto loopColor = reinterpret_cast<MLoopCol *>(loopColorPtr);
-        const double gamma = 1.0 / 2.2;
-        if (attrIndex == 0) {
-            #pragma omp parallel for
-            for (int i = 0; i < loopCount; i++) {
-                auto color = std::get<0>(attr)[i];
-                loopColor[i].r = static_cast<unsigned char>(zeno::clamp(zeno::pow(color[0], gamma) * 255.0, 0.0, 255.0));
-                loopColor[i].g = static_cast<unsigned char>(zeno::clamp(zeno::pow(color[1], gamma) * 255.0, 0.0, 255.0));
-                loopColor[i].b = static_cast<unsigned char>(zeno::clamp(zeno::pow(color[2], gamma) * 255.0, 0.0, 255.0));
-                loopColor[i].a = 255; // todo: support vec4f attributes in future
-            }
-        } else if (attrIndex == 1) {
-            #pragma omp parallel for
-            for (int i = 0; i < loopCount; i++) {
-                auto color = std::get<1>(attr)[i];
-                auto graylevel = static_cast<unsigned char>(zeno::clamp(zeno::pow(color, gamma) * 255.0, 0.0, 255.0));
-                loopColor[i].r = graylevel;
-                loopColor[i].g = graylevel;
-                loopColor[i].b = graylevel;
-                loopColor[i].a = 255;
-            }
+    m.def("meshGetManifest", []
+            ( uintptr_t meshPtr
+            ) -> py::dict
+    {
+        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
+
+        // attributes are listed in the order meshWriteBuffers expects their pointers
+        // (attributes also exported as colors go out as colors only)
+        py::list attrs;
+        for (auto const &[key, value] : mesh->vert_attrs()) {
+            if (mesh->colors.count(key)) continue;
+            attrs.append(py::make_tuple(key, "POINT", attrTypeName(key, value)));
+        }
+        for (auto const &[key, value] : mesh->poly.attrs) {
+            if (mesh->colors.count(key)) continue;
+            attrs.append(py::make_tuple(key, "FACE", attrTypeName(key, value)));
+        }
+        for (auto const &[key, value] : mesh->colors) {
+            attrs.append(py::make_tuple(key, mesh->color_domain,
+                        mesh->color_bytes ? "BYTE_COLOR" : "FLOAT_COLOR"));
         }
-    });
 
-    m.def("meshGetUseAutoSmooth", []
-        ( uintptr_t meshPtr
-        ) -> bool
+        py::dict manifest;
+        manifest["vert_count"] = mesh->verts().size();
+        manifest["loop_count"] = mesh->loop.size();
+        manifest["poly_count"] = mesh->poly.size();
+        manifest["edge_count"] = mesh->edge.size();
+        manifest["matrix"] = mesh->matrix;
+        manifest["is_smooth"] = mesh->is_smooth;
+        manifest["use_auto_smooth"] = mesh->use_auto_smooth;
+        manifest["has_loop_edges"] = mesh->loop_edge.size() == mesh->loop.size();
+        manifest["has_loop_normals"] = mesh->loop_nrm.size() && mesh->loop_nrm.size() == mesh->loop.size();
+        manifest["has_loop_uvs"] = mesh->loop_uv.size() && mesh->loop_uv.size() == mesh->loop.size();
+        manifest["instance_collection"] = mesh->instance_collection;
+        manifest["attrs"] = attrs;
+        return manifest;
+    });
+
+    m.def("meshWriteBuffers", []
+            ( uintptr_t meshPtr
+            , uintptr_t vertPtr
+            , uintptr_t loopPtr
+            , uintptr_t polyPtr
+            , uintptr_t edgePtr
+            , uintptr_t loopUVPtr
+            , uintptr_t loopNrmPtr
+            , std::vector<uintptr_t> const &attrPtrs
+            ) -> void
     {
-        auto mesh = reinterpret_cast<zeno::BlenderMesh*>(meshPtr);
-        return mesh->use_auto_smooth;
+        auto mesh = reinterpret_cast<zeno::BlenderMesh *>(meshPtr);
+        size_t vertCount = mesh->verts().size();
+        size_t loopCount = mesh->loop.size();
+        size_t polyCount = mesh->poly.size();
+
+        if (vertPtr) writeVertices(mesh, reinterpret_cast<MVert *>(vertPtr), vertCount);
+        if (loopPtr) writeLoops(mesh, reinterpret_cast<MLoop *>(loopPtr), loopCount);
+        if (polyPtr) writePolygons(mesh, reinterpret_cast<MPoly *>(polyPtr), polyCount);
+        if (edgePtr) writeEdges(mesh, reinterpret_cast<MEdge *>(edgePtr), mesh->edge.size());
+        if (loopUVPtr) writeLoopUVs(mesh, reinterpret_cast<MLoopUV *>(loopUVPtr), loopCount);
+        if (loopNrmPtr) writeLoopNormals(mesh, reinterpret_cast<blender::float3 *>(loopNrmPtr), loopCount);
+
+        auto attrPtr = attrPtrs.begin();
+        for (auto const &[key, value] : mesh->vert_attrs()) {
+            if (mesh->colors.count(key)) continue;
+            if (auto ptr = *attrPtr++) writeAttr(value, ptr, vertCount);
+        }
+        for (auto const &[key, value] : mesh->poly.attrs) {
+            if (mesh->colors.count(key)) continue;
+            if (auto ptr = *attrPtr++) writeAttr(value, ptr, polyCount);
+        }
+        for (auto const &[key, value] : mesh->colors) {
+            if (auto ptr = *attrPtr++) writeColors(value, ptr, value.size(), mesh->color_bytes);
+        }
     });
 
     py::bind_vector<std::vector<float>>(m, "FloatVec3");
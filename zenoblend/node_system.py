@@ -1,4 +1,6 @@
 import bpy
+import json
+import os
 from bpy.types import NodeTree, Node, NodeSocket
 from nodeitems_utils import NodeCategory, NodeItem
 from nodeitems_utils import register_node_categories
@@ -7,6 +9,7 @@ from bpy.utils import register_class, unregister_class
 from . import scenario
 from . import gpu_drawer
 from . import tree_dumper
+from . import tree_compiler
 
 
 class ZenoNodeTree(NodeTree):
@@ -21,6 +24,9 @@ class ZenoNodeTree(NodeTree):
         self.batch = None
         self.draw_handler = None
 
+    def update(self):
+        tree_compiler.bump_tree_revision(self)
+
     def enabled_callback(self, context):
         if self.zeno_enabled:  # if the state is switched from false to true
             scenario.reload_scene()
@@ -34,6 +40,10 @@ class ZenoNodeTree(NodeTree):
             scenario.reload_scene()
             scenario.frame_update_callback()
 
+    def preview_callback(self, context):
+        if not self.zeno_cached:
+            scenario.frame_update_callback()
+
     def cached_callback(self, context):
         if self.zeno_cached:  # if the state is switched from false to true
             scenario.frame_update_callback()
@@ -44,6 +54,8 @@ class ZenoNodeTree(NodeTree):
     zeno_enabled: bpy.props.BoolProperty(name="Enabled", default=True, description='Enable Graph', update=enabled_callback)
     zeno_realtime_update: bpy.props.BoolProperty(name="Realtime Update", default=True, description='Realtime Update', update=realtime_update_callback)
     zeno_cached: bpy.props.BoolProperty(name="Cached", default=False, description='Cache frames', update=cached_callback)
+    zeno_preview: bpy.props.BoolProperty(name="Preview", default=False, description='Evaluate on decimated inputs while editing, renders use full resolution', update=preview_callback)
+    zeno_preview_resolution: bpy.props.IntProperty(name="Preview Resolution", default=64, min=1, description='Grid cells along the longest side of each input mesh in preview mode', update=preview_callback)
     
 
 class ZenoNodeCategory(NodeCategory):
@@ -168,7 +180,16 @@ def eval_category_icon(type):
 
 
 def eval_defl(socket, defl, type):
-    if not defl: return
+    if defl is None or defl == '': return
+    if not isinstance(defl, str):  # parsed by core.getDescriptors already
+        try:
+            socket.default_value = defl
+        except (TypeError, ValueError):
+            pass
+        return
+    if type == 'NodeSocketString':  # may contain spaces
+        socket.default_value = defl
+        return
     defl_list = defl.split(' ')
     defl = defl_list[0]
     minval = defl[1] if len(defl_list) > 1 else None
@@ -181,8 +202,6 @@ def eval_defl(socket, defl, type):
         elif type == 'NodeSocketVector':
             x, y, z = defl.split(',')
             socket.default_value = (float(x), float(y), float(z))
-        elif type == 'NodeSocketString':
-            socket.default_value = str(defl)
         elif type == 'NodeSocketBool':
             socket.default_value = bool(int(defl))
         elif type.startswith('ZenoNodeSocket_Enum_'):
@@ -203,6 +222,7 @@ def def_node_class(name, inputs, outputs, category):
         bl_icon = eval_category_icon(category)
         zeno_type = name
         zeno_category = category
+        zeno_root = tree_dumper.is_root_descriptor(inputs, outputs)
 
         def init(self, context):
             self.init_sockets(inputs, outputs)
@@ -263,7 +283,11 @@ def def_node_class(name, inputs, outputs, category):
                 to_socket = to_node.inputs[to_socket]
                 node_tree.links.new(from_socket, to_socket)
 
+        def socket_value_update(self, context):
+            tree_compiler.bump_tree_revision(self.id_data)
+
         def update(self):  # rewrite update function
+            tree_compiler.bump_tree_revision(self.id_data)
             if self.id_data.zeno_realtime_update:
                 print('updating by node edit')
                 scenario.frame_update_callback()
@@ -276,6 +300,7 @@ def def_node_class(name, inputs, outputs, category):
 class ZenoNode_Subgraph(def_node_class('Subgraph', [], [], 'subgraph')):
     '''Zeno specialized Subgraph node'''
     bl_icon = 'COMMUNITY'
+    zeno_root = False  # its outputs come from the called tree, not the descriptor
 
     graph_name: bpy.props.StringProperty()
 
@@ -307,6 +332,21 @@ class ZenoNode_FinalOutput(def_node_class('FinalOutput', [], [], 'subgraph')):
         row.operator("node.zeno_stop", text="Stop")
 
 
+class ZenoNode_SubInput:
+    '''Zeno specialized mixin SubInput node'''
+    zeno_root = True  # looked up by name by the calling Subgraph node
+
+
+class ZenoNode_SubOutput:
+    '''Zeno specialized mixin SubOutput node'''
+    zeno_root = True
+
+
+class ZenoNode_SubCategory:
+    '''Zeno specialized mixin SubCategory node'''
+    zeno_root = True
+
+
 class ZenoNode_BlenderInputText:
     '''Zeno specialized mixin BlenderInputText node'''
     text: bpy.props.StringProperty()
@@ -316,6 +356,15 @@ class ZenoNode_BlenderInputText:
     def draw_buttons(self, context, layout):
         layout.prop_search(self, 'text', bpy.data, 'texts', text='', icon='TEXT')
 
+class ZenoNode_BlenderInputImage:
+    '''Zeno specialized mixin BlenderInputImage node'''
+    image: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'image': 'images'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'image', bpy.data, 'images', text='', icon='IMAGE_DATA')
+
 class ZenoNode_BlenderInputAxes:
     '''Zeno specialized mixin BlenderInputAxes node'''
     objid: bpy.props.StringProperty()
@@ -325,6 +374,15 @@ class ZenoNode_BlenderInputAxes:
     def draw_buttons(self, context, layout):
         layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
 
+class ZenoNode_BlenderInputCamera:
+    '''Zeno specialized mixin BlenderInputCamera node'''
+    objid: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'objid': 'objects'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='CAMERA_DATA')
+
 class ZenoNode_BlenderInputPrimitive:
     '''Zeno specialized mixin BlenderInputPrimitive node'''
     objid: bpy.props.StringProperty()
@@ -335,6 +393,16 @@ class ZenoNode_BlenderInputPrimitive:
         layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
 
 
+class ZenoNode_BlenderInputCollider:
+    '''Zeno specialized mixin BlenderInputCollider node'''
+    objid: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'objid': 'objects'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
+
+
 class ZenoNode_BlenderOutputPrimitive:
     '''Zeno specialized mixin BlenderOutputPrimitive node'''
     objid: bpy.props.StringProperty()
@@ -345,31 +413,100 @@ class ZenoNode_BlenderOutputPrimitive:
         layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
 
 
+class ZenoNode_BlenderOutputVolume:
+    '''Zeno specialized mixin BlenderOutputVolume node'''
+    objid: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'objid': 'objects'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
+
+
+class ZenoNode_BlenderOutputCurves:
+    '''Zeno specialized mixin BlenderOutputCurves node'''
+    objid: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'objid': 'objects'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
+
+
+class ZenoNode_BlenderOutputInstances:
+    '''Zeno specialized mixin BlenderOutputInstances node'''
+    objid: bpy.props.StringProperty()
+    instance: bpy.props.StringProperty()
+
+    bpy_data_inputs = {'objid': 'objects', 'instance': 'collections'}
+
+    def draw_buttons(self, context, layout):
+        layout.prop_search(self, 'objid', bpy.data, 'objects', text='', icon='OBJECT_DATA')
+        layout.prop_search(self, 'instance', bpy.data, 'collections', text='', icon='OUTLINER_COLLECTION')
+
+
 #class ZenoNode_BlenderLineViewer(def_node_class('BlenderLineViewer', [('PrimitiveObject', 'prim', ''), ('bool', 'display:', '1')], [], 'blender')):
 #    '''Zeno specialized BlenderLineViewer node'''
 
 
 
-def get_descriptors():
-    node_descriptors = []
-    from .dll import core
-    descs = core.dumpDescriptors()
-    for desc in descs.splitlines():
-        if not desc.startswith('DESC@'):
+descriptor_generation = 0  # of the newest descriptors node classes were made from
+
+
+def get_descriptors(since=0):
+    '''Descriptors of the node types loaded after the given generation, defaults parsed'''
+    global descriptor_generation
+    from .dll import core, deferredDescriptors
+    descriptor_generation, node_descriptors = core.getDescriptors(since)
+    if not since:
+        # deferred libraries get their classes too, they are loaded only
+        # once a scene uses their nodes (see dll.requireScene)
+        node_descriptors = node_descriptors + deferredDescriptors()
+    return node_descriptors
+
+
+descriptor_cache_version = 2
+
+
+def get_descriptor_cache_key():
+    # the module and every extension library it may load, size and mtime
+    # stand in for their hashes, as reading them all would cost more than
+    # what the cache saves
+    from .dll import relative_path
+    bin_dir = relative_path('bin')
+    stamps = []
+    for name in sorted(os.listdir(bin_dir)):
+        if 'zeno' not in name:
             continue
-        _, title, rest = desc.split('@', 2)
-        assert rest[0] == '{' and rest[-1] == '}', rest
-        inputs, outputs, params, category = rest[1:-1].split('}{')
-        inputs = inputs.split('%') if inputs else []
-        outputs = outputs.split('%') if outputs else []
-        params = params.split('%') if params else []
-        inputs = [x.split('@') for x in inputs]
-        outputs = [x.split('@') for x in outputs]
-        params = [x.split('@') for x in params]
-        inputs += [(x, y + ':', z.split(' ')[0]) for x, y, z in params]
-        inputs = [(x, y, z) for x, y, z in inputs if y != 'SRC']
-        outputs = [(x, y, z) for x, y, z in outputs if y != 'DST']
-        node_descriptors.append((title, inputs, outputs, category))
+        st = os.stat(os.path.join(bin_dir, name))
+        stamps.append([name, st.st_size, st.st_mtime_ns])
+    return [descriptor_cache_version, bool(os.environ.get('ZEN_NOAUTOLOAD')), stamps]
+
+
+def get_descriptor_cache_path():
+    return os.path.join(bpy.utils.user_resource('CONFIG'), 'zenoblend_descriptors.json')
+
+
+def get_cached_descriptors():
+    '''Like get_descriptors, from the on-disk cache while the libraries are unchanged'''
+    key = get_descriptor_cache_key()
+    path = get_descriptor_cache_path()
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        if cache['key'] == key:
+            return cache['descriptors']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    node_descriptors = get_descriptors()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'key': key, 'descriptors': node_descriptors}, f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print('WARNING: cannot write node descriptor cache:', e)
     return node_descriptors
 
 
@@ -387,7 +524,7 @@ def descriptor_to_class(desc):
     elif not hasattr(Def, 'zeno_type'):  # mixin-specialized
         OldDef = def_node_class(title, inputs, outputs, category)
         class NewDef(OldDef, Def):
-            pass
+            zeno_root = getattr(Def, 'zeno_root', OldDef.zeno_root)
         NewDef.__name__ = OldDef.__name__
         return NewDef
 
@@ -396,7 +533,7 @@ def descriptor_to_class(desc):
 
 
 def init_node_classes():
-    node_descriptors = get_descriptors()
+    node_descriptors = get_cached_descriptors()
 
     node_classes.clear()
     node_pre_categories.clear()
@@ -407,6 +544,31 @@ def init_node_classes():
         if desc[0] == 'Subgraph': continue
         node_pre_categories.setdefault(Def.zeno_category, []).append(Def.__name__)
 
+
+def add_new_node_classes():
+    '''Register classes for the node types of the libraries loaded since startup'''
+    known = {Def.zeno_type for Def in node_classes}
+    new_classes = []
+    for desc in get_descriptors(descriptor_generation):
+        if desc[0] in known: continue
+        Def = descriptor_to_class(desc)
+        register_class(Def)
+        new_classes.append(Def)
+        node_classes.append(Def)
+        if desc[0] == 'Subgraph': continue
+        node_pre_categories.setdefault(Def.zeno_category, []).append(Def.__name__)
+
+    if new_classes and getattr(init_node_categories, 'initialized', False):
+        deinit_node_classes()
+        init_node_categories()
+    return new_classes
+
+
+def init_node_categories():
+    if getattr(init_node_categories, 'initialized', False):
+        return
+    init_node_categories.initialized = True
+
     node_categories = []
     for name, node_names in node_pre_categories.items():
         items = [NodeItem(n) for n in node_names]
@@ -416,9 +578,35 @@ def init_node_classes():
 
 
 def deinit_node_classes():
+    if not getattr(init_node_categories, 'initialized', False):
+        return
+    init_node_categories.initialized = False
+
     unregister_node_categories('ZENO_NODES')
 
 
+# the add menu categories (a menu class each) are only registered once a
+# zeno node editor gets drawn, keeping them off blender's startup
+categories_draw_handler = None
+
+
+def lazy_init_node_categories():
+    global categories_draw_handler
+    if categories_draw_handler is not None:
+        bpy.types.SpaceNodeEditor.draw_handler_remove(categories_draw_handler, 'WINDOW')
+        categories_draw_handler = None
+    init_node_categories()
+
+
+def categories_draw_callback():
+    space = bpy.context.space_data
+    if space is None or space.tree_type != 'ZenoNodeTree':
+        return
+    # classes can't be registered while drawing, do it right after
+    if not bpy.app.timers.is_registered(lazy_init_node_categories):
+        bpy.app.timers.register(lazy_init_node_categories)
+
+
 def init_node_subgraphs():
     if getattr(init_node_subgraphs, 'initialized', False):
         return
@@ -464,14 +652,34 @@ classes = (
 )
 
 
+@bpy.app.handlers.persistent
+def clear_compiled_trees(*unused):
+    # undo and file loads swap the trees without any update callback
+    tree_compiler.clear_caches()
+
+
+compile_cache_handlers = (
+    bpy.app.handlers.undo_post,
+    bpy.app.handlers.redo_post,
+    bpy.app.handlers.load_post,
+)
+
+
 def register():
     init_node_classes()
+    for handlers in compile_cache_handlers:
+        if clear_compiled_trees not in handlers:
+            handlers.append(clear_compiled_trees)
 
     for cls in node_classes:
         register_class(cls)
     for cls in classes:
         register_class(cls)
 
+    global categories_draw_handler
+    categories_draw_handler = bpy.types.SpaceNodeEditor.draw_handler_add(
+            categories_draw_callback, (), 'WINDOW', 'POST_PIXEL')
+
     #init_node_subgraphs()
 
 
@@ -479,6 +687,17 @@ def unregister():
     try: deinit_node_subgraphs()
     except: pass
 
+    for handlers in compile_cache_handlers:
+        if clear_compiled_trees in handlers:
+            handlers.remove(clear_compiled_trees)
+
+    global categories_draw_handler
+    if bpy.app.timers.is_registered(lazy_init_node_categories):
+        bpy.app.timers.unregister(lazy_init_node_categories)
+    if categories_draw_handler is not None:
+        bpy.types.SpaceNodeEditor.draw_handler_remove(categories_draw_handler, 'WINDOW')
+        categories_draw_handler = None
+
     for cls in enum_types_cache.values():
         unregister_class(cls)
     enum_types_cache.clear()
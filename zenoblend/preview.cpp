@@ -0,0 +1,94 @@
+#include "BlenderMesh.h"
+#include <algorithm>
+#include <cstdint>
+
+namespace zeno {
+
+// vertex clustering: snap vertices to a grid of `resolution` cells along the
+// longest side of the bounding box, merge each cell into its centroid and
+// drop the polygons and edges that collapse
+void decimate_mesh(BlenderMesh *mesh, int resolution) {
+    auto &vert = mesh->vert;
+    int nverts = vert.size();
+    if (!nverts || resolution <= 0)
+        return;
+
+    vec3f bmin = vert[0], bmax = vert[0];
+    for (int i = 1; i < nverts; i++) {
+        bmin = zeno::min(bmin, vert[i]);
+        bmax = zeno::max(bmax, vert[i]);
+    }
+    auto ext = bmax - bmin;
+    float cell = std::max(ext[0], std::max(ext[1], ext[2])) / resolution;
+    if (!(cell > 0))
+        return;
+
+    std::vector<std::pair<uint64_t, int>> keys(nverts);
+    #pragma omp parallel for
+    for (int i = 0; i < nverts; i++) {
+        auto p = (vert[i] - bmin) / cell;
+        uint64_t x = uint64_t(p[0]), y = uint64_t(p[1]), z = uint64_t(p[2]);
+        keys[i] = {x | y << 21 | z << 42, i};
+    }
+    std::sort(keys.begin(), keys.end());
+
+    std::vector<int> cluster(nverts);
+    std::vector<vec3f> centroid;
+    std::vector<int> weight;
+    for (int k = 0; k < nverts; k++) {
+        if (k == 0 || keys[k].first != keys[k - 1].first) {
+            centroid.emplace_back(0, 0, 0);
+            weight.push_back(0);
+        }
+        centroid.back() += vert[keys[k].second];
+        weight.back()++;
+        cluster[keys[k].second] = centroid.size() - 1;
+    }
+    if (centroid.size() == nverts)
+        return;
+
+    vert.values.resize(centroid.size());
+    #pragma omp parallel for
+    for (int i = 0; i < centroid.size(); i++) {
+        vert[i] = centroid[i] / float(weight[i]);
+    }
+
+    // remap polygons, skipping repeated corners and the polygons left with less than 3
+    int nloops = 0, npolys = 0;
+    for (int i = 0; i < mesh->poly.size(); i++) {
+        auto [start, len] = mesh->poly[i];
+        int newstart = nloops;
+        for (int l = start; l < start + len; l++) {
+            int v = cluster[mesh->loop[l]];
+            if (nloops == newstart || mesh->loop[nloops - 1] != v)
+                mesh->loop[nloops++] = v;
+        }
+        if (nloops - newstart > 1 && mesh->loop[nloops - 1] == mesh->loop[newstart])
+            nloops--;
+        if (nloops - newstart < 3) {
+            nloops = newstart;
+            continue;
+        }
+        mesh->poly[npolys++] = {newstart, nloops - newstart};
+    }
+    mesh->loop.values.resize(nloops);
+    mesh->poly.values.resize(npolys);
+
+    int nedges = 0;
+    for (int i = 0; i < mesh->edge.size(); i++) {
+        int src = cluster[mesh->edge[i].src], dst = cluster[mesh->edge[i].dst];
+        if (src != dst)
+            mesh->edge[nedges++] = {std::min(src, dst), std::max(src, dst)};
+    }
+    std::sort(mesh->edge.values.begin(), mesh->edge.values.begin() + nedges,
+            [] (auto const &a, auto const &b) {
+        return a.src != b.src ? a.src < b.src : a.dst < b.dst;
+    });
+    auto end = std::unique(mesh->edge.values.begin(), mesh->edge.values.begin() + nedges,
+            [] (auto const &a, auto const &b) {
+        return a.src == b.src && a.dst == b.dst;
+    });
+    mesh->edge.values.resize(end - mesh->edge.values.begin());
+}
+
+}
@@ -0,0 +1,105 @@
+'''
+Replay a bundle written by the "Capture Zeno Bundle" operator, without Blender:
+
+    python -m zenoblend.replay bundle.npz -n 20
+
+The bundle holds the dumped scene, the settings of the captured frame, the
+exact MVert/MLoop/MPoly/MEdge arrays each input mesh was handed over with and
+the pixels of the input images.
+'''
+
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from .dll import core
+from . import api
+
+
+def _load_inputs(data, inputs, prefix):
+    result = []
+    for i, input in enumerate(inputs):
+        buffers = None
+        if input['mesh']:
+            buffers = tuple(data['{}{}_{}'.format(prefix, i, key)] for key in ('vert', 'loop', 'poly', 'edge'))
+        result.append((input['name'], input['matrix'], buffers, input.get('camera')))
+    return result
+
+
+def load_bundle(path):
+    data = np.load(path)
+    meta = json.loads(str(data['meta']))
+    inputs = _load_inputs(data, meta['inputs'], 'input')
+    shared = meta.get('shared')
+    sharedInputs = _load_inputs(data, shared['inputs'], 'shared_input') if shared else None
+    images = {name: data['image{}'.format(i)] for i, name in enumerate(meta.get('images', ()))}
+    return meta, inputs, sharedInputs, images
+
+
+def _set_inputs(graphPtr, inputs, images):
+    for name, matrix, buffers, camera in inputs:
+        if camera is not None:
+            core.graphSetInputCamera(graphPtr, name, tuple(map(tuple, matrix)), *camera)
+        elif buffers is None:
+            core.graphSetInputAxis(graphPtr, name, tuple(map(tuple, matrix)))
+        else:
+            api.set_mesh_buffers(graphPtr, name, matrix, buffers)
+    for name in core.graphGetImageNames(graphPtr):
+        api.set_image(graphPtr, name, images[name])
+
+
+def replay(path, repeat=10, read_outputs=False, cache_dir=None):
+    '''Apply the captured graph `repeat` times, returns the seconds spent by each run'''
+    meta, inputs, sharedInputs, images = load_bundle(path)
+    timings = []
+    with api.Scene(meta['scene'], meta.get('texts')) as scene:
+        for i in range(repeat):
+            sharedTime = 0
+            if sharedInputs is not None:
+                # the nodes the graph shares with other trees, evaluated first
+                sharedPtr = scene.prepare(meta['shared']['graph'], meta['frame'], cache_dir, meta['preview'])
+                _set_inputs(sharedPtr, sharedInputs, images)
+                t0 = time.perf_counter()
+                core.graphApply(sharedPtr)
+                sharedTime = time.perf_counter() - t0
+
+            graphPtr = scene.prepare(meta['graph'], meta['frame'], cache_dir, meta['preview'])
+            _set_inputs(graphPtr, inputs, images)
+
+            t0 = time.perf_counter()
+            core.graphApply(graphPtr)
+            if read_outputs:
+                for name in core.graphGetOutputNames(graphPtr):
+                    api.get_output(graphPtr, name)
+            timings.append(sharedTime + time.perf_counter() - t0)
+    return meta, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zenoblend.replay',
+            description='Replay a captured Zeno bundle and report its timings')
+    parser.add_argument('bundle', help='.npz bundle written by the capture operator')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='number of graph applies')
+    parser.add_argument('--outputs', action='store_true', help='also time reading the outputs back')
+    parser.add_argument('--cache-dir', help='directory for per-frame cache files (default: temp dir)')
+    args = parser.parse_args(argv)
+
+    meta, timings = replay(args.bundle, args.repeat, args.outputs, args.cache_dir)
+    print('graph `{}` at frame {} (captured in blender {})'.format(
+        meta['graph'], meta['frame'], meta['blender']))
+    for input in meta['inputs']:
+        print('  input `{}`: {}'.format(input['name'],
+            '{vert} verts, {poly} polys, {edge} edges'.format(**input['counts'])
+            if input['mesh'] else 'camera' if input.get('camera') else 'transform only'))
+    for i, t in enumerate(timings):
+        print('  run {:3d}: {:.4f}s'.format(i, t))
+    if timings:
+        print('min {:.4f}s  median {:.4f}s  mean {:.4f}s'.format(
+            min(timings), statistics.median(timings), statistics.mean(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 import bpy
+import os
 import time
 
-from .dll import core
+from .dll import core, requireScene
+from . import tree_compiler
 
 
 # https://github.com/LuxCoreRender/BlendLuxCore/blob/b1ad8e6041bb088e6e4fc53457421b36139d89e7/export/mesh_converter.py
-def _prepare_mesh(obj, depsgraph, no_modifiers=False):
+def _prepare_mesh(obj, depsgraph, no_modifiers=False, need_faces=True):
     """
     Create a temporary mesh from an object.
     The mesh is guaranteed to be removed when the calling block ends.
@@ -15,6 +17,8 @@ def _prepare_mesh(obj, depsgraph, no_modifiers=False):
         if mesh:
             print(mesh.name)
             ...
+    With need_faces=False, face splitting and normal evaluation are skipped,
+    for consumers that only read vertices or edges.
     """
 
     if no_modifiers:
@@ -27,6 +31,9 @@ def _prepare_mesh(obj, depsgraph, no_modifiers=False):
     if object_eval:
         mesh = object_eval.to_mesh()
 
+        if mesh and not need_faces:
+            return mesh, object_eval.to_mesh_clear
+
         if mesh:
             # TODO test if this makes sense
             # If negative scaling, we have to invert the normals
@@ -60,98 +67,135 @@ def _prepare_mesh(obj, depsgraph, no_modifiers=False):
     return mesh, callback
 
 
-def meshFromBlender(mesh):
-    vertCount = len(mesh.vertices)
+def meshFromBlender(mesh, components=('vert', 'poly', 'edge')):
+    vertCount = len(mesh.vertices) if 'vert' in components else 0
     vertPtr = mesh.vertices[0].as_pointer() if vertCount else 0
 
-    loopCount = len(mesh.loops)
+    loopCount = len(mesh.loops) if 'poly' in components else 0
     loopPtr = mesh.loops[0].as_pointer() if loopCount else 0
 
-    polyCount = len(mesh.polygons)
+    polyCount = len(mesh.polygons) if 'poly' in components else 0
     polyPtr = mesh.polygons[0].as_pointer() if polyCount else 0
 
-    edgeCount = len(mesh.edges)
+    edgeCount = len(mesh.edges) if 'edge' in components else 0
     edgePtr = mesh.edges[0].as_pointer() if edgeCount else 0
 
     return vertPtr, vertCount, loopPtr, loopCount, polyPtr, polyCount, edgePtr, edgeCount
 
 
+def _first_pointer(data):
+    return data[0].as_pointer() if len(data) else 0
+
+
 def meshToBlender(meshPtr, mesh):
-    mesh.clear_geometry()
+    manifest = core.meshGetManifest(meshPtr)
+    vertCount = manifest['vert_count']
+    loopCount = manifest['loop_count']
+    polyCount = manifest['poly_count']
+    edgeCount = manifest['edge_count']
 
-    vertCount = core.meshGetVerticesCount(meshPtr)
+    mesh.clear_geometry()
     mesh.vertices.add(vertCount)
-    assert vertCount == len(mesh.vertices), (vertCount, len(mesh.vertices))
-    vertPtr = mesh.vertices[0].as_pointer() if vertCount else 0
-    core.meshGetVertices(meshPtr, vertPtr, vertCount)
-
-    for attrName, attrType in core.meshGetVertAttrNameType(meshPtr).items():
-        attrType = ['FLOAT_VECTOR', 'FLOAT'][attrType]
-        if attrName not in mesh.attributes:
-            mesh.attributes.new(name=attrName, type=attrType, domain='POINT')
-        elif mesh.attributes[attrName].data_type != attrType or mesh.attributes[attrName].domain != 'POINT':
-            mesh.attributes.remove(mesh.attributes[attrName])
-            mesh.attributes.new(name=attrName, type=attrType, domain='POINT')
-        print('adding POINT attribute', attrName, 'with type', attrType)
-
-        if vertCount:
-            vertAttrPtr = mesh.attributes[attrName].data[0].as_pointer()
-            core.meshGetVertAttr(meshPtr, attrName, vertAttrPtr, vertCount)
-
-    loopCount = core.meshGetLoopsCount(meshPtr)
     mesh.loops.add(loopCount)
-    assert loopCount == len(mesh.loops), (loopCount, len(mesh.loops))
-    loopPtr = mesh.loops[0].as_pointer() if loopCount else 0
-    core.meshGetLoops(meshPtr, loopPtr, loopCount)
-
-    # loop attributes are considered to be vertex color now...
-    for attrName, attrType in core.meshGetLoopAttrNameType(meshPtr).items():
-        bl_attr_name = 'Zeno_'+attrName
-        if bl_attr_name not in mesh.vertex_colors:
-            mesh.vertex_colors.new(name=bl_attr_name)
-        loopColorPtr = mesh.vertex_colors[bl_attr_name].data[0].as_pointer() if loopCount else 0
-        core.meshGetLoopColor(meshPtr, attrName, loopColorPtr, loopCount)
-
-    polyCount = core.meshGetPolygonsCount(meshPtr)
     mesh.polygons.add(polyCount)
-    assert polyCount == len(mesh.polygons), (polyCount, len(mesh.polygons))
-    polyPtr = mesh.polygons[0].as_pointer() if polyCount else 0
-    core.meshGetPolygons(meshPtr, polyPtr, polyCount)
-
-    for attrName, attrType in core.meshGetPolyAttrNameType(meshPtr).items():
-        attrType = ['FLOAT_VECTOR', 'FLOAT'][attrType]
-        if attrName not in mesh.attributes:
-            mesh.attributes.new(name=attrName, type=attrType, domain='FACE')
-        elif mesh.attributes[attrName].data_type != attrType or mesh.attributes[attrName].domain != 'FACE':
-            mesh.attributes.remove(mesh.attributes[attrName])
-            mesh.attributes.new(name=attrName, type=attrType, domain='FACE')
-        print('adding FACE attribute', attrName, 'with type', attrType)
-
-        if polyCount:
-            polyAttrPtr = mesh.attributes[attrName].data[0].as_pointer()
-            core.meshGetPolyAttr(meshPtr, attrName, polyAttrPtr, polyCount)
-
-    edgeCount = core.meshGetEdgesCount(meshPtr)
     mesh.edges.add(edgeCount)
+    assert vertCount == len(mesh.vertices), (vertCount, len(mesh.vertices))
+    assert loopCount == len(mesh.loops), (loopCount, len(mesh.loops))
+    assert polyCount == len(mesh.polygons), (polyCount, len(mesh.polygons))
     assert edgeCount == len(mesh.edges), (edgeCount, len(mesh.edges))
-    edgePtr = mesh.edges[0].as_pointer() if edgeCount else 0
-    core.meshGetEdges(meshPtr, edgePtr, edgeCount)
 
-    mesh.use_auto_smooth = core.meshGetUseAutoSmooth(meshPtr)
+    # create all layers first, adding one may move the others in memory
+    attributes = mesh.attributes
+    layerNames = []
+    for attrName, domain, dataType in manifest['attrs']:
+        attr = attributes.get(attrName)
+        if attr is not None and (attr.data_type != dataType or attr.domain != domain):
+            attributes.remove(attr)
+            attr = None
+        if attr is None:
+            attributes.new(name=attrName, type=dataType, domain=domain)
+        layerNames.append(attrName)
+    if manifest['has_loop_uvs'] and 'UVMap' not in mesh.uv_layers:
+        mesh.uv_layers.new(name='UVMap')
+
+    attrPtrs = []
+    for attrName in layerNames:
+        attrPtrs.append(_first_pointer(attributes[attrName].data))
+    uvPtr = _first_pointer(mesh.uv_layers['UVMap'].data) if manifest['has_loop_uvs'] else 0
+    normals = None
+    if manifest['has_loop_normals']:
+        # solver computed normals, set in bulk below instead of being recomputed
+        import numpy as np
+        normals = np.empty((loopCount, 3), dtype=np.float32)
+
+    core.meshWriteBuffers(meshPtr,
+            _first_pointer(mesh.vertices), _first_pointer(mesh.loops),
+            _first_pointer(mesh.polygons), _first_pointer(mesh.edges),
+            uvPtr, normals.ctypes.data if normals is not None else 0, attrPtrs)
+
+    mesh.use_auto_smooth = manifest['use_auto_smooth']
+
+    if manifest['has_loop_edges']:
+        # topology is complete already, only let blender flag the loose edges
+        mesh.update(calc_edges=False, calc_edges_loose=True)
+    else:
+        mesh.update()
+
+    if normals is not None:
+        mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(normals)
 
-    mesh.update()
+    return manifest
 
 
 sceneId = None
 lastJsonStr = None
+geometryRevisions = {}
+inputRevisions = {}
+
+
+def bump_geometry_revision(id):
+    key = id.id_type, id.name
+    geometryRevisions[key] = geometryRevisions.get(key, 0) + 1
+
+
+def get_geometry_revision(blenderObj):
+    blenderMesh = blenderObj.data
+    # objects deformed by modifiers, shape keys or animated mesh data may change
+    # geometry on any frame without telling us, never reuse them
+    if blenderObj.modifiers or blenderMesh.shape_keys is not None \
+            or blenderMesh.animation_data is not None:
+        return None
+    return (blenderMesh.name,
+            geometryRevisions.get(('OBJECT', blenderObj.name), 0),
+            geometryRevisions.get(('MESH', blenderMesh.name), 0))
+
+
+uploadedTexts = set()
+
+
+def upload_texts():
+    # send the bodies of the new text keys in the dump, forget the unused ones
+    from .tree_dumper import text_bodies
+    for key, body in text_bodies.items():
+        if key not in uploadedTexts:
+            core.textSetBody(key, body)
+            uploadedTexts.add(key)
+    for key in uploadedTexts - text_bodies.keys():
+        core.textDropBody(key)
+        uploadedTexts.discard(key)
 
 
 def load_scene(jsonStr):
     print(time.strftime('[%H:%M:%S]'), 'load_scene')
     global sceneId
     global lastJsonStr
+    global sharedAppliedPass
     delete_scene()
     lastJsonStr = jsonStr
+    sharedAppliedPass = None
+    upload_texts()
+    requireScene(jsonStr)
     sceneId = core.createScene()
     core.sceneLoadFromJson(sceneId, jsonStr)
 
@@ -178,6 +222,7 @@ def delete_scene():
         core.deleteScene(sceneId)
         hadScene = True
     sceneId = None
+    inputRevisions.clear()
     
     for nodetree in get_enabled_trees():
         nodetree.nextFrameId = None
@@ -187,22 +232,51 @@ def delete_scene():
     return hadScene
 
 
-def graph_deal_input(graphPtr, inputName):
+def get_camera_info(blenderObj):
+    '''View projection matrix, resolution, clip range and ortho flag of a camera object'''
+    render = bpy.context.scene.render
+    scale = render.resolution_percentage / 100
+    resolution = int(render.resolution_x * scale), int(render.resolution_y * scale)
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    projection = blenderObj.calc_matrix_camera(depsgraph,
+            x=resolution[0], y=resolution[1],
+            scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y)
+    viewProjection = projection @ blenderObj.matrix_world.inverted()
+    camera = blenderObj.data
+    return (tuple(map(tuple, viewProjection)), resolution,
+            (camera.clip_start, camera.clip_end), camera.type == 'ORTHO')
+
+
+def graph_deal_input(graphPtr, inputName, components, previewRes=0):
     if inputName not in bpy.data.objects:
         raise RuntimeError('No object named `{}` in scene'.format(inputName))
     blenderObj = bpy.data.objects[inputName]
     matrix = tuple(map(tuple, blenderObj.matrix_world))
-    depsgraph = bpy.context.evaluated_depsgraph_get()
     prepareCallback = lambda: None
     blenderMesh = blenderObj.data
 
-    if blenderMesh is None:
+    if 'camera' in components:
+        if not isinstance(blenderMesh, bpy.types.Camera):
+            raise RuntimeError('Object `{}` is not a camera'.format(inputName))
+        core.graphSetInputCamera(graphPtr, inputName, matrix, *get_camera_info(blenderObj))
+
+    elif blenderMesh is None or components <= {'matrix'}:
         core.graphSetInputAxis(graphPtr, inputName, matrix)
 
     elif isinstance(blenderMesh, bpy.types.Mesh):
-        preparedMesh, prepareCallback = _prepare_mesh(blenderObj, depsgraph)
-        meshData = meshFromBlender(preparedMesh)
-        core.graphSetInputMesh(graphPtr, inputName, matrix, *meshData)
+        revision = get_geometry_revision(blenderObj)
+        if revision is not None:
+            revision += (previewRes,)
+        if revision is not None and inputRevisions.get((graphPtr, inputName)) == revision:
+            if core.graphSetInputMatrix(graphPtr, inputName, matrix):
+                return prepareCallback
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        preparedMesh, prepareCallback = _prepare_mesh(blenderObj, depsgraph,
+                need_faces='poly' in components)
+        meshData = meshFromBlender(preparedMesh, components)
+        core.graphSetInputMesh(graphPtr, inputName, matrix, *meshData, revision is not None)
+        inputRevisions[graphPtr, inputName] = revision
 
     else:
         raise RuntimeError('Unexpected input object type: {}'.format(blenderMesh))
@@ -210,10 +284,252 @@ def graph_deal_input(graphPtr, inputName):
     return prepareCallback
 
 
+def _capture_inputs(graphPtr, arrays, prefix):
+    import ctypes
+    import numpy as np
+    from .api import MVert, MLoop, MPoly, MEdge
+
+    inputs = []
+    inputComponents = core.graphGetInputComponents(graphPtr)
+    for i, inputName in enumerate(core.graphGetInputNames(graphPtr)):
+        components = inputComponents.get(inputName, {'matrix', 'vert', 'poly', 'edge'})
+        if inputName not in bpy.data.objects:
+            raise RuntimeError('No object named `{}` in scene'.format(inputName))
+        blenderObj = bpy.data.objects[inputName]
+        input = {'name': inputName, 'matrix': list(map(list, blenderObj.matrix_world)), 'mesh': False}
+        inputs.append(input)
+        if 'camera' in components and isinstance(blenderObj.data, bpy.types.Camera):
+            input['camera'] = get_camera_info(blenderObj)
+            continue
+        if not isinstance(blenderObj.data, bpy.types.Mesh) or components <= {'matrix'}:
+            continue
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        preparedMesh, prepareCallback = _prepare_mesh(blenderObj, depsgraph,
+                need_faces='poly' in components)
+        try:
+            meshData = meshFromBlender(preparedMesh, components)
+            counts = {}
+            for j, (key, dtype) in enumerate(zip(('vert', 'loop', 'poly', 'edge'), (MVert, MLoop, MPoly, MEdge))):
+                ptr, count = meshData[j * 2], meshData[j * 2 + 1]
+                # copied byte for byte, as graphSetInputMesh would read them
+                raw = ctypes.string_at(ptr, count * dtype.itemsize) if count else b''
+                arrays['{}{}_{}'.format(prefix, i, key)] = np.frombuffer(raw, dtype=dtype)
+                counts[key] = count
+        finally:
+            prepareCallback()
+        input['mesh'] = True
+        input['counts'] = counts
+    return inputs
+
+
+def get_image_revision(image):
+    # movies, sequences and images being painted on change without telling us
+    if image.source in {'MOVIE', 'SEQUENCE'} or image.is_dirty:
+        return None
+    return (image.name, tuple(image.size), image.channels,
+            geometryRevisions.get(('IMAGE', image.name), 0))
+
+
+def graph_deal_images(graphPtr):
+    import ctypes
+    import numpy as np
+    for imageName in core.graphGetImageNames(graphPtr):
+        if imageName not in bpy.data.images:
+            raise RuntimeError('No image named `{}` in blend file'.format(imageName))
+        image = bpy.data.images[imageName]
+        revision = get_image_revision(image)
+        if revision is not None and inputRevisions.get((graphPtr, 'IMAGE', imageName)) == revision:
+            continue
+
+        width, height = image.size
+        count = width * height * image.channels
+        ptr = core.graphAllocImage(graphPtr, imageName, width, height, image.channels)
+        if count:
+            # straight into the graph's buffer, without going through python floats;
+            # foreach_get wants a buffer of format 'f', ctypes arrays report '<f'
+            buffer = np.ctypeslib.as_array((ctypes.c_float * count).from_address(ptr))
+            image.pixels.foreach_get(buffer)
+        inputRevisions[graphPtr, 'IMAGE', imageName] = revision
+
+
+def capture_bundle(graph_name, path):
+    '''Write the scene, frame settings, input meshes and images of a graph to one .npz file'''
+    import json
+    import numpy as np
+    from .tree_dumper import dump_scene, text_bodies
+
+    jsonStr = dump_scene()
+    if sceneId is None or lastJsonStr != jsonStr:
+        load_scene(jsonStr)
+    tree = bpy.data.node_groups[graph_name]
+    arrays = {}
+
+    shared = None
+    if graph_name in tree_compiler.shared_consumers:
+        core.sceneSwitchToGraph(sceneId, tree_compiler.SHARED_GRAPH)
+        shared = {
+            'graph': tree_compiler.SHARED_GRAPH,
+            'inputs': _capture_inputs(core.sceneGetCurrentGraph(sceneId), arrays, 'shared_input'),
+        }
+
+    core.sceneSwitchToGraph(sceneId, graph_name)
+    inputs = _capture_inputs(core.sceneGetCurrentGraph(sceneId), arrays, 'input')
+
+    images = sorted(get_image_dependencies(graph_name))
+    for i, imageName in enumerate(images):
+        image = bpy.data.images[imageName]
+        width, height = image.size
+        pixels = np.empty((height, width, image.channels), dtype=np.float32)
+        image.pixels.foreach_get(pixels.ravel())
+        arrays['image{}'.format(i)] = pixels
+
+    meta = {
+        'graph': graph_name,
+        'frame': bpy.context.scene.frame_current,
+        'preview': get_preview_resolution(tree, tree.zeno_cached),
+        'blender': bpy.app.version_string,
+        'scene': jsonStr,
+        'inputs': inputs,
+        'shared': shared,
+        'images': images,
+        'texts': dict(text_bodies),
+    }
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def volumeToBlender(volumePtr, volume):
+    path = core.volumeGetPath(volumePtr)
+    try:
+        st = os.stat(path)
+    except OSError:
+        print('WARNING: volume cache `{}` not written'.format(path))
+        return
+    stamp = '{}:{}'.format(st.st_mtime_ns, st.st_size)
+    # setting filepath reloads all the grids, skip it when the file is unchanged
+    if volume.filepath != path or volume.get('zeno_stamp') != stamp:
+        volume.filepath = path
+        volume['zeno_stamp'] = stamp
+
+
+# name of the value of each element of a bpy attribute, by its data type
+attr_value_keys = {
+    'FLOAT': 'value',
+    'INT': 'value',
+    'FLOAT2': 'vector',
+    'FLOAT_VECTOR': 'vector',
+    'FLOAT_COLOR': 'color',
+}
+
+
+warnedLegacyCurves = set()  # curve data blocks warned about dropping attributes
+
+
+def curvesToBlender(curvesPtr, curves):
+    import numpy as np
+    curveCount = core.curvesGetCurvesCount(curvesPtr)
+    pointCount = core.curvesGetPointsCount(curvesPtr)
+    sizes = np.empty(curveCount, dtype=np.int32)
+    core.curvesGetSizes(curvesPtr, sizes.ctypes.data, curveCount)
+    points = np.empty((pointCount, 3), dtype=np.float32)
+    core.curvesGetPoints(curvesPtr, points.ctypes.data, pointCount)
+    cyclic = np.empty(curveCount, dtype=bool)
+    core.curvesGetCyclic(curvesPtr, cyclic.ctypes.data, curveCount)
+
+    from .api import attr_dtypes
+
+    attrs = {}
+    for attrName, dataType in core.curvesGetPointAttrNameType(curvesPtr).items():
+        dtype, shape = attr_dtypes[dataType]
+        buf = np.empty((pointCount,) + shape, dtype=dtype)
+        core.curvesGetPointAttr(curvesPtr, attrName, buf.ctypes.data, pointCount)
+        attrs[attrName] = dataType, buf
+
+    if isinstance(curves, bpy.types.Curve):
+        # legacy curve data has no bulk resize, fill it one spline at a time,
+        # each from slices of the flattened arrays; its points only hold a
+        # radius and a tilt, other attributes can't be kept
+        dropped = sorted(name for name, (dataType, buf) in attrs.items()
+                if name not in ('radius', 'tilt') or dataType != 'FLOAT')
+        if dropped and curves.name not in warnedLegacyCurves:
+            warnedLegacyCurves.add(curves.name)
+            print('WARNING: legacy curves `{}` cannot hold the point attributes {}, '
+                    'they are only kept with the Curves data block (Blender 3.5+)'.format(
+                        curves.name, ', '.join(dropped)))
+        curves.dimensions = '3D'
+        curves.splines.clear()
+        co = np.ones((pointCount, 4), dtype=np.float32)
+        co[:, :3] = points
+        pointAttrs = [(name, attrs[name][1]) for name in ('radius', 'tilt')
+                if name in attrs and name not in dropped]
+        begin = 0
+        for size, closed in zip(sizes.tolist(), cyclic.tolist()):
+            end = begin + size
+            spline = curves.splines.new('POLY')
+            spline.points.add(size - 1)
+            spline.points.foreach_set('co', co[begin:end].ravel())
+            for name, buf in pointAttrs:
+                spline.points.foreach_set(name, buf[begin:end])
+            spline.use_cyclic_u = closed
+            begin = end
+        return
+
+    if len(curves.curves):
+        curves.remove_curves()
+    curves.add_curves(sizes.tolist())
+    curves.attributes['position'].data.foreach_set('vector', points.ravel())
+    for attrName, (dataType, buf) in attrs.items():
+        key = attr_value_keys[dataType]
+        attr = curves.attributes.get(attrName)
+        if attr is not None and (attr.data_type != dataType or attr.domain != 'POINT'):
+            curves.attributes.remove(attr)
+            attr = None
+        if attr is None:
+            attr = curves.attributes.new(attrName, dataType, 'POINT')
+        attr.data.foreach_set(key, buf.ravel())
+    if cyclic.any() or 'cyclic' in curves.attributes:
+        attr = curves.attributes.get('cyclic')
+        if attr is None:
+            attr = curves.attributes.new('cyclic', 'BOOLEAN', 'CURVE')
+        attr.data.foreach_set('value', cyclic)
+    curves.update_tag()
+
+
+def has_bulk_curves():
+    # Curves.add_curves is what makes the hair data block writable from python
+    curvesType = getattr(bpy.types, 'Curves', None)
+    return curvesType is not None and 'add_curves' in curvesType.bl_rna.functions
+
+
+output_data_blocks = {
+    'mesh': 'meshes',
+    'volume': 'volumes',
+    'curves': 'hair_curves' if has_bulk_curves() else 'curves',
+}
+
+
+def new_data_block(dataBlocks, name):
+    if dataBlocks == bpy.data.curves:
+        return dataBlocks.new(name, 'CURVE')
+    return dataBlocks.new(name)
+
+
+def get_cache_dir():
+    if bpy.data.filepath:
+        cacheDir = bpy.path.abspath(bpy.context.scene.zeno.cache_dir)
+    else:
+        cacheDir = os.path.join(bpy.app.tempdir, 'zeno_cache')
+    os.makedirs(cacheDir, exist_ok=True)
+    return cacheDir
+
+
 def graph_deal_output(graph_name, graphPtr, outputName, is_framed):
+    outType = core.graphGetOutputType(graphPtr, outputName)
+    dataBlocks = getattr(bpy.data, output_data_blocks[outType])
+
     if outputName not in bpy.data.objects:
         print('WARNING: object `{}` not exist, creating now'.format(outputName))
-        blenderMesh = bpy.data.meshes.new(outputName)
+        blenderMesh = new_data_block(dataBlocks, outputName)
         blenderObj = bpy.data.objects.new(outputName, blenderMesh)
         bpy.context.collection.objects.link(blenderObj)
 
@@ -226,35 +542,160 @@ def graph_deal_output(graph_name, graphPtr, outputName, is_framed):
         else:
             blenderMesh = blenderObj.data
 
-    outMeshPtr = core.graphGetOutputMesh(graphPtr, outputName)
-    matrix = core.meshGetMatrix(outMeshPtr)
-    if any(map(any, matrix)):
-        blenderObj.matrix_world = matrix
-
     if is_framed:
         currFrameId = bpy.context.scene.frame_current
         tree = bpy.data.node_groups[graph_name]
         if not hasattr(tree, "frameCache"):
             tree.frameCache = {}
         currFrameCache = tree.frameCache.setdefault(currFrameId, {})
-        currFrameCache[blenderObj.name] = blenderMesh.name
+        currFrameCache[blenderObj.name] = output_data_blocks[outType], blenderMesh.name
 
-    meshToBlender(outMeshPtr, blenderMesh)
+    if outType == 'volume':
+        outVolumePtr = core.graphGetOutputMesh(graphPtr, outputName)
+        volumeToBlender(outVolumePtr, blenderMesh)
+        return
 
+    if outType == 'curves':
+        outCurvesPtr = core.graphGetOutputMesh(graphPtr, outputName)
+        curvesToBlender(outCurvesPtr, blenderMesh)
+        return
 
-def execute_scene(graph_name, is_framed):
-    core.sceneSwitchToGraph(sceneId, graph_name)
-    graphPtr = core.sceneGetCurrentGraph(sceneId)
+    outMeshPtr = core.graphGetOutputMesh(graphPtr, outputName)
+    manifest = meshToBlender(outMeshPtr, blenderMesh)
 
-    core.graphClearDrawBuffer(graphPtr)
+    matrix = manifest['matrix']
+    if any(map(any, matrix)):
+        blenderObj.matrix_world = matrix
+
+    if manifest['instance_collection']:
+        setup_instancer(blenderObj, manifest['instance_collection'])
+
+
+def get_instancer_node_group():
+    name = 'ZenoInstancer'
+    group = bpy.data.node_groups.get(name)
+    if group is not None:
+        return group
 
+    group = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    if hasattr(group, 'interface'):  # blender 4.0+
+        group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+        group.interface.new_socket('Collection', in_out='INPUT', socket_type='NodeSocketCollection')
+        group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    else:
+        group.inputs.new('NodeSocketGeometry', 'Geometry')
+        group.inputs.new('NodeSocketCollection', 'Collection')
+        group.outputs.new('NodeSocketGeometry', 'Geometry')
+
+    nodes, links = group.nodes, group.links
+    groupInput = nodes.new('NodeGroupInput')
+    groupOutput = nodes.new('NodeGroupOutput')
+    collectionInfo = nodes.new('GeometryNodeCollectionInfo')
+    collectionInfo.inputs['Separate Children'].default_value = True
+    collectionInfo.inputs['Reset Children'].default_value = True
+    instanceOnPoints = nodes.new('GeometryNodeInstanceOnPoints')
+    instanceOnPoints.inputs['Pick Instance'].default_value = True
+
+    links.new(groupInput.outputs['Geometry'], instanceOnPoints.inputs['Points'])
+    links.new(groupInput.outputs['Collection'], collectionInfo.inputs['Collection'])
+    links.new(collectionInfo.outputs[0], instanceOnPoints.inputs['Instance'])
+    links.new(instanceOnPoints.outputs['Instances'], groupOutput.inputs[0])
+
+    # per-point transforms come from the attributes of BlenderOutputInstances
+    for attrName, dataType, socketName in [
+            ('rotation', 'FLOAT_VECTOR', 'Rotation'),
+            ('scale', 'FLOAT_VECTOR', 'Scale'),
+            ('instance_index', 'FLOAT', 'Instance Index'),
+            ]:
+        namedAttr = nodes.new('GeometryNodeInputNamedAttribute')
+        namedAttr.data_type = dataType
+        namedAttr.inputs['Name'].default_value = attrName
+        attrOutput = next(s for s in namedAttr.outputs if s.enabled)
+        links.new(attrOutput, instanceOnPoints.inputs[socketName])
+
+    return group
+
+
+def setup_instancer(blenderObj, collectionName):
+    if bpy.app.version < (3, 2, 0):
+        print('WARNING: instancing `{}` requires geometry nodes of blender 3.2+'.format(blenderObj.name))
+        return
+    collection = bpy.data.collections.get(collectionName)
+    if collection is None:
+        print('WARNING: collection `{}` not exist, cannot instance'.format(collectionName))
+        return
+
+    modifier = blenderObj.modifiers.get('ZenoInstancer')
+    if modifier is None:
+        modifier = blenderObj.modifiers.new('ZenoInstancer', 'NODES')
+    group = get_instancer_node_group()
+    if modifier.node_group is not group:
+        modifier.node_group = group
+
+    if hasattr(group, 'interface'):
+        sockets = [s for s in group.interface.items_tree if getattr(s, 'in_out', None) == 'INPUT']
+    else:
+        sockets = list(group.inputs)
+    identifier = next(s.identifier for s in sockets if s.name == 'Collection')
+    if modifier[identifier] is not collection:
+        modifier[identifier] = collection
+
+
+def graph_deal_inputs(graphPtr, previewRes):
     prepareCallbacks = []
     inputNames = core.graphGetInputNames(graphPtr)
+    inputComponents = core.graphGetInputComponents(graphPtr)
     print('graph inputs:', inputNames)
     for inputName in inputNames:
-        cb = graph_deal_input(graphPtr, inputName)
+        components = inputComponents.get(inputName, {'matrix', 'vert', 'poly', 'edge'})
+        cb = graph_deal_input(graphPtr, inputName, components, previewRes)
         prepareCallbacks.append(cb)
+    graph_deal_images(graphPtr)
+    return prepareCallbacks
+
+
+updatePass = 0
+sharedAppliedPass = None
+
+
+def begin_update_pass():
+    # the shared graph runs at most once per pass, however many trees import from it
+    global updatePass
+    updatePass += 1
+
+
+def execute_shared_graph(graph_name):
+    global sharedAppliedPass
+    if graph_name not in tree_compiler.shared_consumers or sharedAppliedPass == updatePass:
+        return
+    sharedAppliedPass = updatePass
+
+    core.sceneSwitchToGraph(sceneId, tree_compiler.SHARED_GRAPH)
+    graphPtr = core.sceneGetCurrentGraph(sceneId)
+    core.graphSetFrameInfo(graphPtr, bpy.context.scene.frame_current, get_cache_dir())
+    # decimated only if every consumer previews, the others need the full inputs
+    previewRes = min((get_preview_resolution(bpy.data.node_groups[name], False)
+            for name in tree_compiler.shared_consumers if name in bpy.data.node_groups), default=0)
+    core.graphSetPreview(graphPtr, previewRes)
 
+    prepareCallbacks = graph_deal_inputs(graphPtr, previewRes)
+    core.graphApply(graphPtr)
+    for cb in prepareCallbacks:
+        cb()
+
+
+def execute_scene(graph_name, is_framed):
+    if not is_framed:
+        execute_shared_graph(graph_name)
+    core.sceneSwitchToGraph(sceneId, graph_name)
+    graphPtr = core.sceneGetCurrentGraph(sceneId)
+
+    core.graphClearDrawBuffer(graphPtr)
+    core.graphSetFrameInfo(graphPtr, bpy.context.scene.frame_current, get_cache_dir())
+    previewRes = get_preview_resolution(bpy.data.node_groups[graph_name], is_framed)
+    core.graphSetPreview(graphPtr, previewRes)
+
+    prepareCallbacks = graph_deal_inputs(graphPtr, previewRes)
     core.graphApply(graphPtr)
 
     outputNames = core.graphGetOutputNames(graphPtr)
@@ -274,8 +715,23 @@ def get_dependencies(graph_name):
     graphPtr = core.sceneGetCurrentGraph(sceneId)
 
     inputNames = core.graphGetInputNames(graphPtr)
+    if graph_name in tree_compiler.shared_consumers:
+        core.sceneSwitchToGraph(sceneId, tree_compiler.SHARED_GRAPH)
+        sharedPtr = core.sceneGetCurrentGraph(sceneId)
+        inputNames = set(inputNames) | set(core.graphGetInputNames(sharedPtr))
     return inputNames
 
+
+def get_image_dependencies(graph_name):
+    graph_names = [graph_name]
+    if graph_name in tree_compiler.shared_consumers:
+        graph_names.append(tree_compiler.SHARED_GRAPH)
+    imageNames = set()
+    for name in graph_names:
+        core.sceneSwitchToGraph(sceneId, name)
+        imageNames |= set(core.graphGetImageNames(core.sceneGetCurrentGraph(sceneId)))
+    return imageNames
+
 def update_frame(graph_name):
     tree = bpy.data.node_groups[graph_name]
     currFrameId = bpy.context.scene.frame_current
@@ -289,20 +745,58 @@ def update_frame(graph_name):
         execute_scene(graph_name, is_framed=True)
         print('update_frame spent', '{:.4f}s'.format(time.time() - t0))
         tree.nextFrameId = currFrameId + 1
+        if currFrameId == bpy.context.scene.zeno.frame_end:
+            # the last frame is baked, release the buffers kept for the next one
+            core.sceneSwitchToGraph(sceneId, graph_name)
+            core.graphTrimBuffers(core.sceneGetCurrentGraph(sceneId))
 
     if currFrameId not in tree.frameCache:
         return
-    for objName, meshName in tree.frameCache[currFrameId].items():
+    for objName, (dataType, meshName) in tree.frameCache[currFrameId].items():
         if objName not in bpy.data.objects:
             continue
-        if meshName not in bpy.data.meshes:
+        dataBlocks = getattr(bpy.data, dataType)
+        if meshName not in dataBlocks:
             continue
         blenderObj = bpy.data.objects[objName]
-        blenderMesh = bpy.data.meshes[meshName]
+        blenderMesh = dataBlocks[meshName]
         if blenderObj.data is not blenderMesh:
             blenderObj.data = blenderMesh
 
 
+isRendering = False
+
+
+def get_preview_resolution(tree, is_framed):
+    # bakes (cached trees) and renders always see the full resolution inputs
+    if tree.zeno_preview and not is_framed and not isRendering:
+        return tree.zeno_preview_resolution
+    return 0
+
+
+def update_preview_trees():
+    begin_update_pass()
+    for tree in get_enabled_trees():
+        if tree.zeno_preview and not tree.zeno_cached:
+            update_scene(tree.name)
+
+
+@bpy.app.handlers.persistent
+def render_pre_callback(*unused):
+    global isRendering
+    isRendering = True
+    if sceneId is not None:
+        update_preview_trees()
+
+
+@bpy.app.handlers.persistent
+def render_post_callback(*unused):
+    global isRendering
+    isRendering = False
+    if sceneId is not None:
+        update_preview_trees()
+
+
 def update_scene(graph_name):
     currFrameId = bpy.context.scene.frame_current
     print(time.strftime('[%H:%M:%S]'), 'update_scene')
@@ -328,6 +822,7 @@ def frame_update_callback(*unused):
         #if not static_tree and not framed_tree:
         #    return False
         reload_scene()
+        begin_update_pass()
         for tree in get_enabled_trees():
             if tree.zeno_cached:
                 update_frame(tree.name)
@@ -352,6 +847,11 @@ def scene_update_callback(scene, depsgraph):
         return
 
     scene_reloaded = False
+    begin_update_pass()
+
+    for update in depsgraph.updates:
+        if update.is_updated_geometry or isinstance(update.id, bpy.types.Image):
+            bump_geometry_revision(update.id)
 
     for tree in get_enabled_trees():
         if tree.zeno_realtime_update:
@@ -362,15 +862,20 @@ def scene_update_callback(scene, depsgraph):
             else:
                 static_tree = tree.name
                 our_deps = get_dependencies(static_tree)
+                our_images = get_image_dependencies(static_tree)
 
                 needs_update = False
                 for update in depsgraph.updates:
                     object = update.id
                     if isinstance(object, bpy.types.Mesh):
                         object = object.id_data
-                    if not isinstance(object, bpy.types.Object):
+                    if isinstance(object, bpy.types.Image):
+                        deps = our_images
+                    elif isinstance(object, bpy.types.Object):
+                        deps = our_deps
+                    else:
                         continue
-                    if object.name in our_deps:
+                    if object.name in deps:
                         print(time.strftime('[%H:%M:%S]'), 'update cause:', object.name)
                         needs_update = True
                         break
@@ -403,6 +908,11 @@ def register():
         bpy.app.handlers.frame_change_post.append(frame_update_callback)
     if scene_update_callback not in bpy.app.handlers.depsgraph_update_post:
         bpy.app.handlers.depsgraph_update_post.append(scene_update_callback)
+    if render_pre_callback not in bpy.app.handlers.render_pre:
+        bpy.app.handlers.render_pre.append(render_pre_callback)
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if render_post_callback not in handlers:
+            handlers.append(render_post_callback)
     #if load_post_callback not in bpy.app.handlers.load_post:
         #bpy.app.handlers.load_post.append(load_post_callback)
 
@@ -413,5 +923,10 @@ def unregister():
         bpy.app.handlers.frame_change_post.remove(frame_update_callback)
     if scene_update_callback in bpy.app.handlers.depsgraph_update_post:
         bpy.app.handlers.depsgraph_update_post.remove(scene_update_callback)
+    if render_pre_callback in bpy.app.handlers.render_pre:
+        bpy.app.handlers.render_pre.remove(render_pre_callback)
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if render_post_callback in handlers:
+            handlers.remove(render_post_callback)
     #if load_post_callback in bpy.app.handlers.load_post:
         #bpy.app.handlers.load_post.remove(load_post_callback)
@@ -0,0 +1,291 @@
+'''
+Optional compile step of the tree dumper: inline subgraphs into their callers
+
+Every tree is first turned into a node table, {node name: (node type,
+{input name: ('set', value) or ('bind', source node, source socket)})},
+cached until the tree is edited. Subgraph nodes are then replaced by the
+flattened table of the tree they call, memoized by that tree's content hash,
+so re-dumping after an edit only re-serializes the edited tree.
+
+With share_common_nodes, node chains that are identical across several trees
+(same node types, parameters and upstream chains) are moved to one extra
+graph, evaluated once per update, whose results the trees import.
+'''
+
+import bpy
+import hashlib
+import json
+
+from .tree_dumper import dump_tree, find_reachable_nodes, is_root_type
+
+
+tree_revisions = {}  # bumped by node_system on every edit of a tree
+tree_tables = {}  # tree name -> (cache key, reachable node names, table, content hash)
+flattened_tables = {}  # content hash -> (flattened table, flattened hash)
+
+SHARED_GRAPH = '__zeno_shared__'
+shared_consumers = set()  # trees importing from the shared graph, as of the last dump
+
+# their result depends on the graph evaluating them, not only on their inputs
+unshareable_nodes = {'BlenderSharedExport', 'BlenderSharedImport', 'BlenderPreview'}
+
+# stock node types keeping state across frames (caches, time integrators),
+# so two trees may disagree on them; scene.zeno.unshared_nodes adds more
+stateful_nodes = {
+    'CachedByKey', 'CachedIf', 'CachedOnce', 'RunOnce', 'RunBeforeFrame', 'RunAfterFrame',
+    'IntegrateFrameTime', 'SubstepDt', 'GetFrameTimeElapsed', 'GetFramePortion',
+}
+
+
+def is_shareable(node_type, unshared=()):
+    if node_type in unshareable_nodes or node_type in stateful_nodes or node_type in unshared:
+        return False
+    return not is_root_type(node_type)
+
+
+def bump_tree_revision(tree):
+    tree_revisions[tree.name] = tree_revisions.get(tree.name, 0) + 1
+
+
+def clear_caches():
+    tree_tables.clear()
+    flattened_tables.clear()
+
+
+def table_from_commands(commands):
+    table = {}
+    for command in commands:
+        if command[0] == 'addNode':
+            table[command[2]] = (command[1], {})
+        elif command[0] == 'setNodeInput':
+            table[command[1]][1][command[2]] = ('set', command[3])
+        elif command[0] == 'bindNodeInput':
+            table[command[1]][1][command[2]] = ('bind', command[3], command[4])
+    return table
+
+
+def commands_from_table(table):
+    for node_name, (node_type, inputs) in table.items():
+        yield ('addNode', node_type, node_name)
+        for input_name, input in inputs.items():
+            if input[0] == 'set':
+                yield ('setNodeInput', node_name, input_name, input[1])
+            else:
+                yield ('bindNodeInput', node_name, input_name, input[1], input[2])
+        yield ('completeNode', node_name)
+
+
+def content_hash(data):
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()
+
+
+def get_tree_table(tree):
+    # nodes pulling bpy data (texts, objects) can change without any tree edit
+    key = tree_revisions.get(tree.name, 0), tuple(tree.nodes.keys())
+    cached = tree_tables.get(tree.name)
+    if cached is not None and cached[0] == key:
+        return cached[1:]
+    reachable = find_reachable_nodes(tree)
+    table = table_from_commands(dump_tree(tree, reachable))
+    entry = reachable, table, content_hash(list(table.items()))
+    volatile = any(hasattr(tree.nodes[name], 'bpy_data_inputs') for name in reachable)
+    if not volatile:
+        tree_tables[tree.name] = (key,) + entry
+    return entry
+
+
+def _input_value(inputs, name, default=None):
+    input = inputs.get(name)
+    return input[1] if input is not None and input[0] == 'set' else default
+
+
+def inline_subgraph(table, call_name, sub_table):
+    '''Replace the Subgraph node `call_name` of table by the nodes of sub_table'''
+    call_inputs = table[call_name][1]
+    prefix = call_name + '/'
+
+    sub_inputs = {}
+    for node_name, (node_type, inputs) in sub_table.items():
+        if node_type == 'SubInput':
+            sub_inputs[node_name] = _input_value(inputs, 'name:')
+
+    def resolve(input):
+        if input[0] == 'bind' and input[1] in sub_inputs:
+            port_name = sub_inputs[input[1]]
+            if input[2] == 'hasValue':
+                return ('set', int(port_name in call_inputs))
+            return call_inputs.get(port_name)
+        if input[0] == 'bind':
+            return ('bind', prefix + input[1], input[2])
+        return input
+
+    inlined = {}
+    sub_outputs = {}
+    for node_name, (node_type, inputs) in sub_table.items():
+        if node_type in ('SubInput', 'SubCategory'):
+            continue
+        resolved = {}
+        for input_name, input in inputs.items():
+            input = resolve(input)
+            if input is not None:
+                resolved[input_name] = input
+        if node_type == 'SubOutput':
+            sub_outputs[_input_value(inputs, 'name:')] = resolved.get('port')
+            continue
+        inlined[prefix + node_name] = (node_type, resolved)
+
+    result = {}
+    for node_name, (node_type, inputs) in table.items():
+        if node_name == call_name:
+            result.update(inlined)
+            continue
+        resolved = {}
+        for input_name, input in inputs.items():
+            if input[0] == 'bind' and input[1] == call_name:
+                input = sub_outputs.get(input[2])
+            if input is not None:
+                resolved[input_name] = input
+        result[node_name] = (node_type, resolved)
+    return result
+
+
+def flatten_tree(tree, trees, touched, calling=()):
+    '''Table of tree with all the subgraphs it calls inlined, and its hash'''
+    reachable, table, own_hash = get_tree_table(tree)
+    calls = [(node_name, _input_value(inputs, 'name:'))
+            for node_name, (node_type, inputs) in table.items() if node_type == 'Subgraph']
+    if tree.name in calling:
+        raise RuntimeError('Subgraph `{}` calls itself'.format(tree.name))
+
+    subs = {}
+    for call_name, graph_name in calls:
+        if graph_name in trees and graph_name not in subs:
+            subs[graph_name] = flatten_tree(trees[graph_name], trees, touched, calling + (tree.name,))
+    key = content_hash([own_hash] + sorted((name, sub[1]) for name, sub in subs.items()))
+    touched.add(key)
+    if key in flattened_tables:
+        return flattened_tables[key]
+
+    for call_name, graph_name in calls:
+        if graph_name in subs:
+            table = inline_subgraph(table, call_name, subs[graph_name][0])
+    flattened_tables[key] = table, key
+    return table, key
+
+
+def compile_all_trees():
+    '''Like dump_all_trees, with subgraphs inlined into the enabled trees'''
+    trees = {name: tree for name, tree in bpy.data.node_groups.items()
+            if tree.bl_idname == 'ZenoNodeTree'}
+    touched = set()
+    yield ('clearAllState',)
+    for name, tree in trees.items():
+        if not tree.zeno_enabled: continue
+        table, key = flatten_tree(tree, trees, touched)
+        yield ('switchGraph', name)
+        yield from commands_from_table(table)
+
+    # keep the caches bounded to what the current trees still use
+    for key in [key for key in flattened_tables if key not in touched]:
+        del flattened_tables[key]
+    for name in [name for name in tree_tables if name not in trees]:
+        del tree_tables[name]
+
+
+def graphs_from_commands(commands):
+    graphs = {}
+    graph = None
+    for command in commands:
+        if command[0] == 'switchGraph':
+            graph = graphs.setdefault(command[1], [])
+        elif graph is not None:
+            graph.append(command)
+    return {name: table_from_commands(graph) for name, graph in graphs.items()}
+
+
+def node_hashes(table, unshared=()):
+    '''Content hash of every shareable node of table, covering all its upstream nodes'''
+    hashes = {}
+
+    def visit(node_name):
+        if node_name in hashes:
+            return hashes[node_name]
+        hashes[node_name] = None  # also guards against cycles
+        node_type, inputs = table[node_name]
+        if not is_shareable(node_type, unshared):
+            return None
+        parts = [node_type]
+        for input_name in sorted(inputs):
+            input = inputs[input_name]
+            if input[0] == 'bind':
+                src_hash = visit(input[1]) if input[1] in table else None
+                if src_hash is None:
+                    return None
+                input = ('bind', src_hash, input[2])
+            parts.append((input_name,) + tuple(input))
+        hashes[node_name] = content_hash(parts)
+        return hashes[node_name]
+
+    for node_name in table:
+        visit(node_name)
+    return {name: hash for name, hash in hashes.items() if hash is not None}
+
+
+def share_common_nodes(commands, tree_names, unshared=()):
+    '''Move the nodes found in more than one of tree_names to SHARED_GRAPH'''
+    graphs = graphs_from_commands(commands)
+    hashes = {name: node_hashes(table, unshared) for name, table in graphs.items() if name in tree_names}
+    owners = {}
+    sources = {}  # hash -> node of the nodes with no upstream inputs, like constants
+    for name, tree_hashes in hashes.items():
+        for node_name, hash in tree_hashes.items():
+            owners.setdefault(hash, set()).add(name)
+            node = graphs[name][node_name]
+            if not any(input[0] == 'bind' for input in node[1].values()):
+                sources[hash] = node
+    # sources are cheaper to evaluate again than to import, so each tree keeps
+    # its own, and the shared graph gets a copy of those its nodes bind
+    shared = {hash for hash, names in owners.items() if len(names) > 1 and hash not in sources}
+
+    shared_consumers.clear()
+    shared_table = {}
+    exports = {}
+    for name, tree_hashes in hashes.items():
+        table = graphs[name]
+        imports = {}
+        rest = {}
+        for node_name, (node_type, inputs) in table.items():
+            if tree_hashes.get(node_name) in shared:
+                hash = tree_hashes[node_name]
+                if 'shared:' + hash not in shared_table:
+                    shared_table['shared:' + hash] = (node_type, {
+                        input_name: ('bind', 'shared:' + tree_hashes[input[1]], input[2])
+                        if input[0] == 'bind' else input for input_name, input in inputs.items()})
+                    for input in inputs.values():
+                        if input[0] == 'bind' and tree_hashes[input[1]] in sources:
+                            shared_table['shared:' + tree_hashes[input[1]]] = sources[tree_hashes[input[1]]]
+                continue
+            resolved = {}
+            for input_name, input in inputs.items():
+                if input[0] == 'bind' and tree_hashes.get(input[1]) in shared:
+                    key = tree_hashes[input[1]] + ':' + input[2]
+                    imports['import:' + key] = ('BlenderSharedImport', {'key': ('set', key)})
+                    exports['export:' + key] = ('BlenderSharedExport', {
+                        'object': ('bind', 'shared:' + tree_hashes[input[1]], input[2]),
+                        'key': ('set', key)})
+                    input = ('bind', 'import:' + key, 'object')
+                resolved[input_name] = input
+            rest[node_name] = (node_type, resolved)
+        if imports:
+            shared_consumers.add(name)
+            imports.update(rest)
+            graphs[name] = imports
+
+    yield ('clearAllState',)
+    for name, table in graphs.items():
+        yield ('switchGraph', name)
+        yield from commands_from_table(table)
+    if exports:
+        shared_table.update(exports)
+        yield ('switchGraph', SHARED_GRAPH)
+        yield from commands_from_table(shared_table)
@@ -1,10 +1,54 @@
 import bpy
+import hashlib
 
 
-def dump_tree(tree):
+# params switching a root node on and off
+root_switches = ('active:', 'display:')
+
+
+def is_root_descriptor(inputs, outputs):
+    '''Whether nodes of a descriptor are evaluated for their own sake: sinks
+    declaring no outputs (exporters, viewers), or nodes with a root switch'''
+    return not outputs or any(name in root_switches for type, name, defl in inputs)
+
+
+def is_root_type(node_type):
+    # node types unknown to this session count as roots, so they are never dropped
+    Def = getattr(bpy.types, 'ZenoNode_' + node_type, None)
+    return getattr(Def, 'zeno_root', True)
+
+
+def is_root_node(node):
+    if not getattr(node, 'zeno_root', False):
+        return False
+    for param in root_switches:
+        if param in node.inputs:
+            input = node.inputs[param]
+            return input.is_linked or bool(input.default_value)
+    return True
+
+
+def find_reachable_nodes(tree):
+    '''Names of the nodes the root nodes of a tree depend on, roots included'''
+    stack = [node for node in tree.nodes if hasattr(node, 'zeno_type') and is_root_node(node)]
+    reachable = set()
+    while stack:
+        node = stack.pop()
+        if node.name in reachable: continue
+        reachable.add(node.name)
+        for input in node.inputs:
+            if input.is_linked and len(input.links) == 1:
+                src_node = input.links[0].from_node
+                if hasattr(src_node, 'zeno_type'):
+                    stack.append(src_node)
+    return reachable
+
+
+def dump_tree(tree, node_names=None):
     assert tree.bl_idname == 'ZenoNodeTree', tree
     for node_name, node in tree.nodes.items():
         if not hasattr(node, 'zeno_type'): continue
+        if node_names is not None and node_name not in node_names: continue
         node_type = node.zeno_type
         yield ('addNode', node_type, node_name)
 
@@ -39,17 +83,49 @@ def dump_tree(tree):
         yield ('completeNode', node_name)
 
 
+def find_used_trees():
+    '''Enabled trees and the subgraphs they call, each with its reachable nodes'''
+    trees = {name: tree for name, tree in bpy.data.node_groups.items()
+            if tree.bl_idname == 'ZenoNodeTree'}
+    pending = [name for name, tree in trees.items() if tree.zeno_enabled]
+    used = {}
+    while pending:
+        name = pending.pop()
+        if name in used or name not in trees: continue
+        tree = trees[name]
+        used[name] = find_reachable_nodes(tree)
+        for node_name in used[name]:
+            node = tree.nodes[node_name]
+            if node.zeno_type == 'Subgraph':
+                pending.append(node.graph_name)
+    return used
+
+
 def dump_all_trees():
     yield ('clearAllState',)
+    used = find_used_trees()
     for name, tree in bpy.data.node_groups.items():
-        if tree.bl_idname != 'ZenoNodeTree': continue
+        if name not in used: continue
         yield ('switchGraph', name)
-        yield from dump_tree(tree)
+        yield from dump_tree(tree, used[name])
 
 
 def dump_scene():
     import json
-    data = list(dump_all_trees())
+    text_bodies.clear()
+    if bpy.context.scene.zeno.inline_subgraphs:
+        from .tree_compiler import compile_all_trees
+        data = list(compile_all_trees())
+    else:
+        data = list(dump_all_trees())
+    from .tree_compiler import share_common_nodes, shared_consumers
+    if bpy.context.scene.zeno.share_common_nodes:
+        tree_names = {tree.name for tree in bpy.data.node_groups if tree.bl_idname == 'ZenoNodeTree'
+                and tree.zeno_enabled and not tree.zeno_cached}
+        unshared = set(bpy.context.scene.zeno.unshared_nodes.split())
+        data = list(share_common_nodes(data, tree_names, unshared))
+    else:
+        shared_consumers.clear()
     data = json.dumps(data)
     return data
 
@@ -86,8 +162,22 @@ def find_tree_sub_io_names(tree):
     return inputs, outputs
 
 
+TEXT_PREFIX = 'zenotext:'
+text_bodies = {}  # key -> body of the texts referred to by the last dump, see scenario.upload_texts
+
+
+def text_key(data):
+    # the scene only carries a content key, so big texts don't bloat every dump
+    body = data.as_string()
+    key = TEXT_PREFIX + hashlib.sha1(body.encode()).hexdigest()
+    text_bodies[key] = body
+    return key
+
+
 eval_bpy_data = {
     # possibly support more bpy datablocks, like objects, images, textures
-    'texts': lambda data: data.as_string(),
+    'texts': text_key,
     'objects': lambda data: data.name,
+    'collections': lambda data: data.name,
+    'images': lambda data: data.name,  # pixels go through scenario.graph_deal_images
 }